@@ -1,8 +1,25 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import re
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import engine
+import diagnostics
+import league_store
+from engine import (
+    SIX_GROUPS, DEFAULT_TEMPLATE, position_metrics, UPLOAD_TYPES, minutes_col, LEAGUE_COL,
+    file_digest, filter_fingerprint,
+)
+from charts import (
+    RADAR_IMAGE_FORMAT, RadarImageCache, group_colors, render_radar, z_score_badge,
+    render_radars_parallel, radars_to_zip, radars_to_pdf,
+)
 
 # --- Basic password protection ---
 PASSWORD = "cowboy"
@@ -17,583 +34,302 @@ if pwd != PASSWORD:
     st.warning("Please enter the correct password to access the app.")
     st.stop()
 
-# ========== 6-position mapping ==========
-SIX_GROUPS = [
-    "Goalkeeper",
-    "Wide Defender",
-    "Central Defender",
-    "Central Midfielder",
-    "Wide Midfielder",
-    "Central Forward"
-]
-
-RAW_TO_SIX = {
-    # Goalkeeper
-    "GK": "Goalkeeper", "GKP": "Goalkeeper", "GOALKEEPER": "Goalkeeper",
-
-    # Wide Defender
-    "RB": "Wide Defender", "LB": "Wide Defender",
-    "RWB": "Wide Defender", "LWB": "Wide Defender", "RFB": "Wide Defender", "LFB": "Wide Defender",
-
-    # Central Defender
-    "CB": "Central Defender", "RCB": "Central Defender", "LCB": "Central Defender",
-    "CBR": "Central Defender", "CBL": "Central Defender", "SW": "Central Defender",
-
-    # Central Midfielder
-    "CMF": "Central Midfielder", "CM": "Central Midfielder",
-    "RCMF": "Central Midfielder", "RCM": "Central Midfielder",
-    "LCMF": "Central Midfielder", "LCM": "Central Midfielder",
-    "DMF": "Central Midfielder", "DM": "Central Midfielder", "CDM": "Central Midfielder",
-    "RDMF": "Central Midfielder", "RDM": "Central Midfielder",
-    "LDMF": "Central Midfielder", "LDM": "Central Midfielder",
-    "AMF": "Central Midfielder", "AM": "Central Midfielder", "CAM": "Central Midfielder",
-    "SS": "Central Midfielder", "10": "Central Midfielder",
-
-    # Wide Midfielder
-    "LWF": "Wide Midfielder", "RWF": "Wide Midfielder",
-    "RW": "Wide Midfielder", "LW": "Wide Midfielder",
-    "LAMF": "Wide Midfielder", "RAMF": "Wide Midfielder",
-    "RM": "Wide Midfielder", "LM": "Wide Midfielder",
-    "WF": "Wide Midfielder", "RWG": "Wide Midfielder", "LWG": "Wide Midfielder", "W": "Wide Midfielder",
-
-    # Central Forward
-    "CF": "Central Forward", "ST": "Central Forward", "9": "Central Forward",
-    "FW": "Central Forward", "STK": "Central Forward", "CFW": "Central Forward"
-}
-
-def _clean_pos_token(tok: str) -> str:
-    if pd.isna(tok):
-        return ""
-    t = str(tok).upper()
-    t = t.replace(".", "").replace("-", "").replace(" ", "")
-    return t
-
-def parse_first_position(cell) -> str:
-    if pd.isna(cell):
-        return ""
-    first = re.split(r"[,/]", str(cell))[0].strip()
-    return _clean_pos_token(first)
-
-def map_first_position_to_group(cell) -> str:
-    tok = parse_first_position(cell)
-    return RAW_TO_SIX.get(tok, "Wide Midfielder")  # safe default
-
-# ========== Default template mapping (must match position_metrics keys) ==========
-DEFAULT_TEMPLATE = {
-    "Goalkeeper": "Goalkeeper",
-    "Wide Defender": "Wide Defender, Full Back",
-    "Central Defender": "Central Defender, All Round",
-    "Central Midfielder": "Central Midfielder, All Round CM",
-    "Wide Midfielder": "Wide Midfielder, Touchline Winger",
-    "Central Forward": "Striker, All Round CF"
-}
-
-# ========== Metric sets ==========
-position_metrics = {
-    # ================== GOALKEEPER ==================
-    "Goalkeeper": {
-        "metrics": [
-            "Clean sheets per 90", "Conceded goals per 90", "Prevented goals per 90",
-            "Save rate, %", "Shots against per 90", "Aerial duels per 90", "Exits per 90",
-            "Passes per 90", "Accurate passes, %", "Short / medium passes per 90",
-            "Accurate short / medium passes, %", "Long passes per 90", "Accurate long passes, %"
-        ],
-        "groups": {
-            "Clean sheets per 90": "Goalkeeping",
-            "Conceded goals per 90": "Goalkeeping",
-            "Prevented goals per 90": "Goalkeeping",
-            "Save rate, %": "Goalkeeping",
-            "Shots against per 90": "Goalkeeping",
-            "Aerial duels per 90": "Goalkeeping",
-            "Exits per 90": "Goalkeeping",
-            "Passes per 90": "Possession",
-            "Accurate passes, %": "Possession",
-            "Short / medium passes per 90": "Possession",
-            "Accurate short / medium passes, %": "Possession",
-            "Long passes per 90": "Possession",
-            "Accurate long passes, %": "Possession"
-        }
-    },
-
-    # ================== CENTRAL DEFENDERS ==================
-    "Central Defender, Ball Winning": {
-        "metrics": [
-            "Defensive duels per 90", "Defensive duels won, %",
-            "Aerial duels per 90", "Aerial duels won, %",
-            "Shots blocked per 90", "PAdj Interceptions",
-            "Head goals per 90", "Successful dribbles, %", "Accurate passes, %"
-        ],
-        "groups": {
-            "Defensive duels per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "Aerial duels per 90": "Defensive",
-            "Aerial duels won, %": "Defensive",
-            "Shots blocked per 90": "Defensive",
-            "PAdj Interceptions": "Defensive",
-            "Head goals per 90": "Attacking",
-            "Successful dribbles, %": "Possession",
-            "Accurate passes, %": "Possession"
-        }
-    },
-    "Central Defender, Ball Playing": {
-        "metrics": [
-            "Defensive duels per 90", "Defensive duels won, %",
-            "Shots blocked per 90", "PAdj Interceptions",
-            "Forward passes per 90", "Accurate forward passes, %",
-            "Passes to final third per 90", "Accurate passes to final third, %",
-            "Accurate passes, %", "Dribbles per 90", "Successful dribbles, %"
-        ],
-        "groups": {
-            "Defensive duels per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "Shots blocked per 90": "Defensive",
-            "PAdj Interceptions": "Defensive",
-            "Forward passes per 90": "Possession",
-            "Accurate forward passes, %": "Possession",
-            "Passes to final third per 90": "Possession",
-            "Accurate passes to final third, %": "Possession",
-            "Accurate passes, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession"
-        }
-    },
-    "Central Defender, All Round": {
-        "metrics": [
-            "Defensive duels per 90", "Defensive duels won, %",
-            "Aerial duels per 90", "Aerial duels won, %",
-            "Shots blocked per 90", "PAdj Interceptions",
-            "Accurate passes, %", "Forward passes per 90", "Accurate forward passes, %",
-            "Passes to final third per 90", "Accurate passes to final third, %",
-            "Dribbles per 90", "Successful dribbles, %"
-        ],
-        "groups": {
-            "Defensive duels per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "Aerial duels per 90": "Defensive",
-            "Aerial duels won, %": "Defensive",
-            "Shots blocked per 90": "Defensive",
-            "PAdj Interceptions": "Defensive",
-            "Accurate passes, %": "Possession",
-            "Forward passes per 90": "Possession",
-            "Accurate forward passes, %": "Possession",
-            "Passes to final third per 90": "Possession",
-            "Accurate passes to final third, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession"
-        }
-    },
-
-    # ================== WIDE DEFENDERS ==================
-    "Wide Defender, Full Back": {
-        "metrics": [
-            "Successful defensive actions per 90", "Defensive duels per 90", "Defensive duels won, %",
-            "PAdj Interceptions", "Crosses per 90", "Accurate crosses, %",
-            "Passes to final third per 90", "Accurate passes to final third, %",
-            "Dribbles per 90", "Successful dribbles, %",
-            "xA per 90", "Assists per 90"
-        ],
-        "groups": {
-            "Successful defensive actions per 90": "Defensive",
-            "Defensive duels per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "PAdj Interceptions": "Defensive",
-            "Crosses per 90": "Possession",
-            "Accurate crosses, %": "Possession",
-            "Passes to final third per 90": "Possession",
-            "Accurate passes to final third, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession",
-            "xA per 90": "Attacking",
-            "Assists per 90": "Attacking"
-        }
-    },
-    "Wide Defender, Wing Back": {
-        "metrics": [
-            "Successful defensive actions per 90", "Defensive duels per 90", "Defensive duels won, %",
-            "Dribbles per 90", "Successful dribbles, %", "Offensive duels per 90", "Offensive duels won, %",
-            "Crosses per 90", "Accurate crosses, %", "Passes to final third per 90",
-            "xA per 90", "Assists per 90", "Shot assists per 90"
-        ],
-        "groups": {
-            "Successful defensive actions per 90": "Defensive",
-            "Defensive duels per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession",
-            "Offensive duels per 90": "Possession",
-            "Offensive duels won, %": "Possession",
-            "Crosses per 90": "Possession",
-            "Accurate crosses, %": "Possession",
-            "Passes to final third per 90": "Possession",
-            "xA per 90": "Attacking",
-            "Assists per 90": "Attacking",
-            "Shot assists per 90": "Attacking"
-        }
-    },
-    "Wide Defender, Inverted": {
-        "metrics": [
-            "Successful defensive actions per 90", "Defensive duels per 90", "Defensive duels won, %",
-            "PAdj Interceptions", "Forward passes per 90", "Accurate forward passes, %",
-            "Through passes per 90", "Accurate through passes, %",
-            "Passes to final third per 90", "Accurate passes to final third, %",
-            "xA per 90", "Assists per 90"
-        ],
-        "groups": {
-            "Successful defensive actions per 90": "Defensive",
-            "Defensive duels per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "PAdj Interceptions": "Defensive",
-            "Forward passes per 90": "Possession",
-            "Accurate forward passes, %": "Possession",
-            "Through passes per 90": "Possession",
-            "Accurate through passes, %": "Possession",
-            "Passes to final third per 90": "Possession",
-            "Accurate passes to final third, %": "Possession",
-            "xA per 90": "Attacking",
-            "Assists per 90": "Attacking"
-        }
-    },
-
-    # ================== CENTRAL MIDFIELDERS ==================
-    "Central Midfielder, Creative": {
-        "metrics": [
-            "Non-penalty goals per 90", "xG per 90", "Goal conversion, %",
-            "Assists per 90", "xA per 90", "Shots per 90", "Shots on target, %",
-            "Forward passes per 90", "Accurate forward passes, %",
-            "Through passes per 90", "Accurate through passes, %",
-            "Dribbles per 90", "Successful dribbles, %"
-        ],
-        "groups": {
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Goal conversion, %": "Attacking",
-            "Assists per 90": "Attacking",
-            "xA per 90": "Attacking",
-            "Shots per 90": "Attacking",
-            "Shots on target, %": "Attacking",
-            "Forward passes per 90": "Possession",
-            "Accurate forward passes, %": "Possession",
-            "Through passes per 90": "Possession",
-            "Accurate through passes, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession"
-        }
-    },
-    "Central Midfielder, Defensive": {
-        "metrics": [
-            "Successful defensive actions per 90", "Defensive duels per 90", "Defensive duels won, %",
-            "Aerial duels per 90", "Aerial duels won, %", "PAdj Interceptions",
-            "Successful dribbles, %", "Offensive duels per 90", "Offensive duels won, %",
-            "Accurate passes, %", "Forward passes per 90", "Accurate forward passes, %",
-            "Passes to final third per 90", "Accurate passes to final third, %"
-        ],
-        "groups": {
-            "Successful defensive actions per 90": "Defensive",
-            "Defensive duels per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "Aerial duels per 90": "Defensive",
-            "Aerial duels won, %": "Defensive",
-            "PAdj Interceptions": "Defensive",
-            "Successful dribbles, %": "Possession",
-            "Offensive duels per 90": "Possession",
-            "Offensive duels won, %": "Possession",
-            "Accurate passes, %": "Possession",
-            "Forward passes per 90": "Possession",
-            "Accurate forward passes, %": "Possession",
-            "Passes to final third per 90": "Possession",
-            "Accurate passes to final third, %": "Possession"
-        }
-    },
-    "Central Midfielder, All Round CM": {
-        "metrics": [
-            "Non-penalty goals per 90", "xG per 90", "Goal conversion, %",
-            "Assists per 90", "xA per 90", "Shots per 90", "Shots on target, %",
-            "Forward passes per 90", "Accurate forward passes, %",
-            "Passes to final third per 90", "Accurate passes to final third, %",
-            "Dribbles per 90", "Successful dribbles, %",
-            "Successful defensive actions per 90", "Defensive duels per 90",
-            "Defensive duels won, %", "PAdj Interceptions"
-        ],
-        "groups": {
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Goal conversion, %": "Attacking",
-            "Assists per 90": "Attacking",
-            "xA per 90": "Attacking",
-            "Shots per 90": "Attacking",
-            "Shots on target, %": "Attacking",
-            "Forward passes per 90": "Possession",
-            "Accurate forward passes, %": "Possession",
-            "Passes to final third per 90": "Possession",
-            "Accurate passes to final third, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession",
-            "Successful defensive actions per 90": "Defensive",
-            "Defensive duels per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "PAdj Interceptions": "Defensive"
-        }
-    },
-
-    # ================== WIDE MIDFIELDERS ==================
-    "Wide Midfielder, Touchline Winger": {
-        "metrics": [
-            "Non-penalty goals per 90", "xG per 90", "Assists per 90", "xA per 90",
-            "Crosses per 90", "Accurate crosses, %", "Dribbles per 90", "Successful dribbles, %",
-            "Fouls suffered per 90", "Shot assists per 90",
-            "Passes to penalty area per 90", "Accurate passes to penalty area, %"
-        ],
-        "groups": {
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Assists per 90": "Attacking",
-            "xA per 90": "Attacking",
-            "Crosses per 90": "Possession",
-            "Accurate crosses, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession",
-            "Fouls suffered per 90": "Possession",
-            "Shot assists per 90": "Possession",
-            "Passes to penalty area per 90": "Possession",
-            "Accurate passes to penalty area, %": "Possession"
-        }
-    },
-    "Wide Midfielder, Inverted Winger": {
-        "metrics": [
-            "Non-penalty goals per 90", "xG per 90", "Shots per 90", "Shots on target, %",
-            "Goal conversion, %", "Assists per 90", "xA per 90",
-            "Dribbles per 90", "Successful dribbles, %",
-            "Fouls suffered per 90", "Shot assists per 90",
-            "Passes to penalty area per 90", "Accurate passes to penalty area, %",
-            "Deep completions per 90"
-        ],
-        "groups": {
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Shots per 90": "Attacking",
-            "Shots on target, %": "Attacking",
-            "Goal conversion, %": "Attacking",
-            "Assists per 90": "Attacking",
-            "xA per 90": "Attacking",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession",
-            "Fouls suffered per 90": "Possession",
-            "Shot assists per 90": "Possession",
-            "Passes to penalty area per 90": "Possession",
-            "Accurate passes to penalty area, %": "Possession",
-            "Deep completions per 90": "Possession"
-        }
-    },
-    "Wide Midfielder, Defensive Wide Midfielder": {
-        "metrics": [
-            "Non-penalty goals per 90", "xG per 90", "Shots per 90", "Shots on target, %",
-            "Assists per 90", "xA per 90",
-            "Crosses per 90", "Accurate crosses, %", "Dribbles per 90", "Successful dribbles, %",
-            "Fouls suffered per 90", "Shot assists per 90",
-            "Successful defensive actions per 90", "Defensive duels won, %", "PAdj Interceptions"
-        ],
-        "groups": {
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Shots per 90": "Attacking",
-            "Shots on target, %": "Attacking",
-            "Assists per 90": "Attacking",
-            "xA per 90": "Attacking",
-            "Crosses per 90": "Possession",
-            "Accurate crosses, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession",
-            "Fouls suffered per 90": "Possession",
-            "Shot assists per 90": "Possession",
-            "Successful defensive actions per 90": "Defensive",
-            "Defensive duels won, %": "Defensive",
-            "PAdj Interceptions": "Defensive"
-        }
-    },
-
-    # ================== STRIKERS ==================
-    "Striker, Number 10": {
-        "metrics": [
-            "Successful defensive actions per 90",
-            "Non-penalty goals per 90", "xG per 90", "Shots per 90", "Shots on target, %",
-            "Goal conversion, %", "Assists per 90", "xA per 90", "Shot assists per 90",
-            "Forward passes per 90", "Accurate forward passes, %",
-            "Passes to final third per 90", "Accurate passes to final third, %",
-            "Through passes per 90", "Accurate through passes, %"
-        ],
-        "groups": {
-            "Successful defensive actions per 90": "Off The Ball",
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Shots per 90": "Attacking",
-            "Shots on target, %": "Attacking",
-            "Goal conversion, %": "Attacking",
-            "Assists per 90": "Attacking",
-            "xA per 90": "Attacking",
-            "Shot assists per 90": "Attacking",
-            "Forward passes per 90": "Possession",
-            "Accurate forward passes, %": "Possession",
-            "Passes to final third per 90": "Possession",
-            "Accurate passes to final third, %": "Possession",
-            "Through passes per 90": "Possession",
-            "Accurate through passes, %": "Possession"
-        }
-    },
-    "Striker, Target Man": {
-        "metrics": [
-            "Aerial duels per 90", "Aerial duels won, %",
-            "Non-penalty goals per 90", "xG per 90", "Shots per 90", "Shots on target, %",
-            "Goal conversion, %", "Head goals per 90", "Assists per 90", "xA per 90", "Shot assists per 90",
-            "Offensive duels per 90", "Offensive duels won, %",
-            "Passes to penalty area per 90", "Accurate passes to penalty area, %"
-        ],
-        "groups": {
-            "Aerial duels per 90": "Off The Ball",
-            "Aerial duels won, %": "Off The Ball",
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Shots per 90": "Attacking",
-            "Shots on target, %": "Attacking",
-            "Goal conversion, %": "Attacking",
-            "Head goals per 90": "Attacking",
-            "Assists per 90": "Attacking",
-            "xA per 90": "Attacking",
-            "Shot assists per 90": "Attacking",
-            "Offensive duels per 90": "Possession",
-            "Offensive duels won, %": "Possession",
-            "Passes to penalty area per 90": "Possession",
-            "Accurate passes to penalty area, %": "Possession"
-        }
-    },
-    "Striker, Penalty Box Striker": {
-        "metrics": [
-            "Non-penalty goals per 90", "xG per 90", "Shots per 90", "Shots on target, %",
-            "Goal conversion, %", "Shot assists per 90", "Touches in penalty area per 90",
-            "Offensive duels per 90", "Offensive duels won, %",
-            "Dribbles per 90", "Successful dribbles, %"
-        ],
-        "groups": {
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Shots per 90": "Attacking",
-            "Shots on target, %": "Attacking",
-            "Goal conversion, %": "Attacking",
-            "Shot assists per 90": "Attacking",
-            "Touches in penalty area per 90": "Attacking",
-            "Offensive duels per 90": "Possession",
-            "Offensive duels won, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession"
-        }
-    },
-    "Striker, All Round CF": {
-        "metrics": [
-            "Successful defensive actions per 90", "Aerial duels per 90", "Aerial duels won, %",
-            "Non-penalty goals per 90", "xG per 90", "Shots per 90", "Shots on target, %",
-            "Goal conversion, %", "Assists per 90", "xA per 90", "Shot assists per 90",
-            "Offensive duels per 90", "Offensive duels won, %"
-        ],
-        "groups": {
-            "Successful defensive actions per 90": "Off The Ball",
-            "Aerial duels per 90": "Off The Ball",
-            "Aerial duels won, %": "Off The Ball",
-            "Non-penalty goals per 90": "Attacking",
-            "xG per 90": "Attacking",
-            "Shots per 90": "Attacking",
-            "Shots on target, %": "Attacking",
-            "Goal conversion, %": "Attacking",
-            "Assists per 90": "Attacking",
-            "xA per 90": "Attacking",
-            "Shot assists per 90": "Attacking",
-            "Offensive duels per 90": "Possession",
-            "Offensive duels won, %": "Possession"
-        }
-    },
-    "Striker, Pressing Forward": {
-        "metrics": [
-            "Successful defensive actions per 90", "Defensive duels per 90", "Defensive duels won, %",
-            "Aerial duels per 90", "Aerial duels won, %", "PAdj Interceptions",
-            "Offensive duels per 90", "Offensive duels won, %",
-            "Dribbles per 90", "Successful dribbles, %",
-            "Forward passes per 90", "Accurate forward passes, %",
-            "xA per 90", "Shot assists per 90"
-        ],
-        "groups": {
-            "Successful defensive actions per 90": "Off The Ball",
-            "Defensive duels per 90": "Off The Ball",
-            "Defensive duels won, %": "Off The Ball",
-            "Aerial duels per 90": "Off The Ball",
-            "Aerial duels won, %": "Off The Ball",
-            "PAdj Interceptions": "Off The Ball",
-            "Offensive duels per 90": "Possession",
-            "Offensive duels won, %": "Possession",
-            "Dribbles per 90": "Possession",
-            "Successful dribbles, %": "Possession",
-            "Forward passes per 90": "Possession",
-            "Accurate forward passes, %": "Possession",
-            "xA per 90": "Attacking",
-            "Shot assists per 90": "Attacking"
-        }
-    }
-}
-
-# Colors
-group_colors = {
-    "Off The Ball": "crimson",
-    "Attacking": "royalblue",
-    "Possession": "seagreen",
-    "Defensive": "darkorange",
-    "Goalkeeping": "purple"
-}
-
-# ---------- File upload ----------
-uploaded_file = st.file_uploader("Upload your Excel file", type=["xlsx"])
-if not uploaded_file:
-    st.stop()
+if engine.CUSTOM_TEMPLATES_ERROR:
+    st.error(f"Custom templates were not loaded, only the built-in ones are available. {engine.CUSTOM_TEMPLATES_ERROR}")
+
+# ---------- Diagnostics (opt-in) ----------
+# Times each stage of this rerun, tracks peak memory and cache hits, and appends
+# a line per rerun to diagnostics.TRACE_PATH. Off by default: tracemalloc slows
+# every allocation in the process while it runs.
+diagnostics_on = st.sidebar.checkbox(
+    "Diagnostics", value=os.environ.get("RADAR_DIAGNOSTICS", "") not in ("", "0"),
+    help="Show per-stage timings, peak memory and cache hits for each rerun"
+)
+# Tracing is shared by every session; this session's handle counts it in or out
+if "memory_tracing" not in st.session_state:
+    st.session_state.memory_tracing = diagnostics.MemoryTracing()
+st.session_state.memory_tracing.set(diagnostics_on)
+diag = diagnostics.StageRecorder(diagnostics_on)
+
+# ---------- Cached pipeline stages ----------
+# ingest -> filter -> percentile -> score -> rank -> render. Each engine stage is
+# cached on the file digest plus only the inputs it depends on, so a widget
+# change recomputes just the stages downstream of it (a new player only re-renders).
+INGEST_CACHE_ENTRIES = 8  # prepared frames kept in memory, least recently used evicted first
+STAGE_CACHE_ENTRIES = 32
+
+@diagnostics.count_calls
+@st.cache_resource(max_entries=INGEST_CACHE_ENTRIES, show_spinner="Reading file...")
+def load_prepared_frame(digest: str, file_type: str, _data: bytes):
+    # Keyed on the digest only (underscore args are not hashed), so reruns and
+    # other sessions uploading the same bytes share this one frame. It is the
+    # read-only base table: filters select rows with masks, nothing writes to it.
+    # Its metrics are mapped from the on-disk dataset store, which other server
+    # processes attach to as well, so the OS holds one copy for all of them.
+    diagnostics.count_miss("load_prepared_frame")
+    base, unmapped_positions, _ = engine.load_shared_dataset(_data, file_type, digest)
+    return base, unmapped_positions
+
+@diagnostics.count_calls
+@st.cache_resource(max_entries=INGEST_CACHE_ENTRIES, show_spinner="Reading the league store...")
+def query_store(store_key: str, leagues: tuple, seasons: tuple, min_minutes: int):
+    # store_key changes whenever a partition is rewritten; only the chosen
+    # partitions, and within them the rows over min_minutes, are read
+    diagnostics.count_miss("query_store")
+    return league_store.query(leagues, seasons, min_minutes)
+
+@diagnostics.count_calls
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, show_spinner=False)
+def filter_rows(digest: str, min_minutes: int, age_range, groups: tuple, leagues: tuple, _base: pd.DataFrame) -> np.ndarray:
+    diagnostics.count_miss("filter_rows")
+    return engine.filter_rows(_base, min_minutes, age_range, groups, leagues)
+
+@diagnostics.count_calls
+@st.cache_resource(max_entries=INGEST_CACHE_ENTRIES, show_spinner=False)
+def numeric_matrix(digest: str, _base: pd.DataFrame):
+    diagnostics.count_miss("numeric_matrix")
+    attached = engine.attach_numeric(digest)
+    return attached[0] if attached else engine.numeric_matrix(_base)
+
+@diagnostics.count_calls
+@st.cache_resource(max_entries=INGEST_CACHE_ENTRIES, show_spinner="Measuring against the reference population...")
+def reference_percentiles(digest: str, min_minutes: int, _base: pd.DataFrame) -> pd.DataFrame:
+    # Every row of the file against the fixed reference, once; filters then
+    # only select rows from it
+    diagnostics.count_miss("reference_percentiles")
+    numeric = numeric_matrix(digest, _base)
+    reference = engine.reference_index(_base, min_minutes, numeric)
+    return engine.reference_percentiles(_base, np.arange(len(_base)), reference, numeric)
+
+@diagnostics.count_calls
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, show_spinner=False)
+def percentile_matrix(digest: str, fingerprint: str, reference_minutes, _base: pd.DataFrame, _rows: np.ndarray) -> pd.DataFrame:
+    # reference_minutes None ranks within the filtered pool
+    diagnostics.count_miss("percentile_matrix")
+    if reference_minutes is not None:
+        return reference_percentiles(digest, reference_minutes, _base).iloc[_rows]
+    return engine.percentile_matrix(_base, _rows, numeric_matrix(digest, _base))
+
+@diagnostics.count_calls
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, show_spinner=False)
+def criteria_mask(digest: str, fingerprint: str, criteria: tuple, template: str, _base: pd.DataFrame, _pool_rows: np.ndarray):
+    diagnostics.count_miss("criteria_mask")
+    return engine.criteria_mask(_base, _pool_rows, criteria, numeric_matrix(digest, _base), template)
+
+@diagnostics.count_calls
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, show_spinner=False)
+def player_index(digest: str, fingerprint: str, _base: pd.DataFrame, _rows: np.ndarray):
+    diagnostics.count_miss("player_index")
+    return engine.player_index(_base, _rows)
+
+@diagnostics.count_calls
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, show_spinner=False)
+def score_players(digest: str, fingerprint: str, template: str, reference_minutes, _base: pd.DataFrame, _rows: np.ndarray) -> pd.DataFrame:
+    diagnostics.count_miss("score_players")
+    return engine.score_players(
+        _base, _rows, template,
+        percentiles=percentile_matrix(digest, fingerprint, reference_minutes, _base, _rows),
+        player_keys=player_index(digest, fingerprint, _base, _rows)[0],
+    )
 
-df = pd.read_excel(uploaded_file)
+@diagnostics.count_calls
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, show_spinner=False)
+def rank_players(digest: str, fingerprint: str, template: str, top_k: int, _plot_data: pd.DataFrame) -> pd.DataFrame:
+    diagnostics.count_miss("rank_players")
+    return engine.rank_players(_plot_data, top_k)
+
+@diagnostics.count_calls
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, show_spinner=False)
+def role_fit(digest: str, fingerprint: str, reference_minutes, _base: pd.DataFrame, _rows: np.ndarray):
+    diagnostics.count_miss("role_fit")
+    return engine.role_fit(percentile_matrix(digest, fingerprint, reference_minutes, _base, _rows))
+
+@diagnostics.count_calls
+@st.cache_data(max_entries=STAGE_CACHE_ENTRIES, show_spinner=False)
+def similarity_index(digest: str, fingerprint: str, template: str, reference_minutes, _base: pd.DataFrame, _rows: np.ndarray):
+    diagnostics.count_miss("similarity_index")
+    return engine.similarity_index(percentile_matrix(digest, fingerprint, reference_minutes, _base, _rows), template)
+
+# ---------- Background cache warming ----------
+# Once a file and the base filters are known, a small thread pool computes the
+# views an analyst usually opens next (the whole pool and each six-group with
+# its default template) into the caches above, so those reruns are hits.
+WARM_WORKERS = 2
+RANKING_DEFAULT_TOP_K = 200
+
+class CacheWarmer:
+    def __init__(self, key, executor: ThreadPoolExecutor):
+        self.key = key
+        self.executor = executor
+        # Dropped with the session's state when the session ends: cancel what is still queued
+        weakref.finalize(self, executor.shutdown, wait=False, cancel_futures=True)
+
+    def cancel(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def warm_population(digest: str, base: pd.DataFrame, min_minutes: int, age_range, groups: tuple, leagues: tuple, template: str, reference_minutes):
+    # Same calls, in the same argument form, as the interactive path below
+    rows = filter_rows(digest, min_minutes, age_range, groups, leagues, base)
+    if len(rows) == 0:
+        return
+    fingerprint = filter_fingerprint(filter_fingerprint(min_minutes, age_range, groups, leagues), (), reference_minutes)
+    player_index(digest, fingerprint, base, rows)
+    plot_data = score_players(digest, fingerprint, template, reference_minutes, base, rows)
+    rank_players(digest, fingerprint, template, min(RANKING_DEFAULT_TOP_K, len(plot_data)), plot_data)
+    role_fit(digest, fingerprint, reference_minutes, base, rows)
+    similarity_index(digest, fingerprint, template, reference_minutes, base, rows)
+
+def start_cache_warming(key, jobs):
+    # One warm-up per session; new base filters or a new file cancel the old one
+    warmer = st.session_state.get("cache_warmer")
+    if warmer is not None:
+        if warmer.key == key:
+            return
+        warmer.cancel()
+    ctx = get_script_run_ctx()
+    executor = ThreadPoolExecutor(
+        max_workers=WARM_WORKERS, thread_name_prefix="radar-warm",
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    )
+    for job in jobs:
+        executor.submit(warm_population, *job)
+    st.session_state.cache_warmer = CacheWarmer(key, executor)
+
+# ---------- Data source ----------
+# Either one uploaded file, or any leagues and seasons saved to the local league store
+stored_partitions = league_store.partitions()
+data_source = "Upload a file"
+if not stored_partitions.empty:
+    data_source = st.radio("Data source", ["Upload a file", "League store"], horizontal=True)
+
+def minutes_input() -> int:
+    return st.number_input("Minimum minutes to include", min_value=0, value=1000, step=50)
+
+if data_source == "League store":
+    store_leagues = st.multiselect("Leagues", sorted(stored_partitions["league"].unique()))
+    league_partitions = stored_partitions[stored_partitions["league"].isin(store_leagues)]
+    store_seasons = st.multiselect("Seasons", sorted(league_partitions["season"].unique()), help="None selected means every season")
+    if not store_leagues:
+        st.info("Pick one or more leagues from the store.")
+        st.stop()
 
-# ---------- Positions ----------
-if "Position" in df.columns:
-    df["Positions played"] = df["Position"].astype(str)
+    # The minutes filter goes into the Parquet scan. Age and six-group stay masks:
+    # the slider range, the group options and the fixed reference need the rows
+    # outside them, and the reference needs players from REFERENCE_MIN_MINUTES up.
+    min_minutes = minutes_input()
+    scan_minutes = min(min_minutes, engine.REFERENCE_MIN_MINUTES)
+    with diag.stage("ingest"):
+        store_key = league_store.store_fingerprint()
+        file_id = filter_fingerprint(store_key, tuple(store_leagues), tuple(store_seasons), scan_minutes)
+        base_df = query_store(store_key, tuple(store_leagues), tuple(store_seasons), scan_minutes)
+    unmapped_positions = pd.Series(dtype="int64")
 else:
-    df["Positions played"] = np.nan
+    uploaded_file = st.file_uploader("Upload your data file (Excel, CSV, Parquet or Feather)", type=UPLOAD_TYPES)
+    if not uploaded_file:
+        st.stop()
 
-df["Six-Group Position"] = df["Position"].apply(map_first_position_to_group) if "Position" in df.columns else np.nan
+    file_bytes = uploaded_file.getvalue()
+    file_type = os.path.splitext(uploaded_file.name)[1].lstrip(".").lower()
+    with diag.stage("ingest"):
+        file_id = file_digest(file_bytes)
+        base_df, unmapped_positions = load_prepared_frame(file_id, file_type, file_bytes)
+
+    with st.expander("Save to the league store"):
+        with st.form("save_to_store", border=False):
+            c1, c2 = st.columns(2)
+            store_league = c1.text_input(
+                "League", placeholder="One per sheet" if LEAGUE_COL in base_df.columns else "",
+                help="Leave empty to save each sheet of a multi-sheet workbook as its own league"
+            )
+            store_season = c2.text_input(
+                "Season", placeholder="2024/25",
+                help="Players already saved to this league and season with the same name and height are replaced, even if they changed teams"
+            )
+            if st.form_submit_button("Save"):
+                try:
+                    written, replaced = league_store.append(base_df, store_league, store_season)
+                except (ValueError, OSError) as exc:
+                    st.error(f"Could not save: {exc}")
+                else:
+                    target = store_league.strip() or "one league per sheet"
+                    st.success(f"Saved {written} players to {target}, {store_season.strip()}, replacing {replaced} already stored.")
+
+if not unmapped_positions.empty:
+    with st.expander(f"{len(unmapped_positions)} position code(s) not in RAW_TO_SIX, counted as Wide Midfielder"):
+        st.dataframe(
+            unmapped_positions.rename_axis("Position code").reset_index(name="Players"),
+            hide_index=True, use_container_width=True
+        )
 
 # ---------- Minutes filter ----------
-minutes_col = "Minutes played"
-min_minutes = st.number_input("Minimum minutes to include", min_value=0, value=1000, step=50)
-df["_minutes_numeric"] = pd.to_numeric(df.get(minutes_col, np.nan), errors="coerce")
-df = df[df["_minutes_numeric"] >= min_minutes].copy()
-if df.empty:
+if data_source != "League store":
+    min_minutes = minutes_input()
+with diag.stage("filter"):
+    minutes_rows = filter_rows(file_id, min_minutes, None, (), (), base_df)
+if len(minutes_rows) == 0:
     st.warning("No players meet the minutes threshold. Lower the minimum.")
     st.stop()
 
 # ---------- Age slider filter ----------
-if "Age" in df.columns:
-    df["_age_numeric"] = pd.to_numeric(df["Age"], errors="coerce")
-    if df["_age_numeric"].notna().any():
-        age_min = int(np.nanmin(df["_age_numeric"]))
-        age_max = int(np.nanmax(df["_age_numeric"]))
-        sel_min, sel_max = st.slider("Age range to include", min_value=age_min, max_value=age_max, value=(age_min, age_max), step=1)
-        df = df[df["_age_numeric"].between(sel_min, sel_max)].copy()
-    else:
-        st.info("Age column has no numeric values, age filter skipped.")
+age_range = None
+# prepare_frame always adds _age_numeric, all NaN when the export has no Age
+ages = base_df["_age_numeric"].to_numpy(dtype=float)[minutes_rows]
+if np.isfinite(ages).any():
+    age_min = int(np.nanmin(ages))
+    age_max = int(np.nanmax(ages))
+    sel_min, sel_max = st.slider("Age range to include", min_value=age_min, max_value=age_max, value=(age_min, age_max), step=1)
+    age_range = (sel_min, sel_max)
+elif base_df["Age"].notna().any():
+    st.info("Age column has no numeric values, age filter skipped.")
 else:
     st.info("No Age column found, age filter skipped.")
 
-st.caption(f"Filtering on '{minutes_col}' ≥ {min_minutes}. Players remaining, {len(df)}")
-
-# ---------- 6-group filter ----------
-available_groups = [g for g in SIX_GROUPS if g in df["Six-Group Position"].unique()]
-selected_groups = st.multiselect("Include groups", options=available_groups, default=[], label_visibility="collapsed")
-if selected_groups:
-    df = df[df["Six-Group Position"].isin(selected_groups)].copy()
-    if df.empty:
-        st.warning("No players after 6-group filter. Clear filters or choose different groups.")
+with diag.stage("filter"):
+    pool_rows = filter_rows(file_id, min_minutes, age_range, (), (), base_df)
+st.caption(f"Filtering on '{minutes_col}' ≥ {min_minutes}. Players remaining, {len(pool_rows)}")
+
+# ---------- 6-group and league filters ----------
+present_groups = set(base_df["Six-Group Position"].iloc[pool_rows].dropna().unique())
+available_groups = [g for g in SIX_GROUPS if g in present_groups]
+# Multi-sheet workbooks and the league store carry a league per row
+available_leagues = []
+if LEAGUE_COL in base_df.columns:
+    available_leagues = sorted(base_df[LEAGUE_COL].iloc[pool_rows].dropna().unique())
+if len(available_leagues) > 1:
+    group_col, league_col = st.columns(2)
+    with group_col:
+        selected_groups = st.multiselect("Include groups", options=available_groups, default=[], placeholder="All groups", label_visibility="collapsed")
+    with league_col:
+        selected_leagues = st.multiselect("Include leagues", options=available_leagues, default=[], placeholder="All leagues", label_visibility="collapsed")
+else:
+    selected_groups = st.multiselect("Include groups", options=available_groups, default=[], label_visibility="collapsed")
+    selected_leagues = []
+if selected_groups or selected_leagues:
+    with diag.stage("filter"):
+        pool_rows = filter_rows(file_id, min_minutes, age_range, tuple(selected_groups), tuple(selected_leagues), base_df)
+    if len(pool_rows) == 0:
+        st.warning("No players after the 6-group and league filters. Clear filters or choose different groups or leagues.")
         st.stop()
 
+# ---------- Percentile reference ----------
+percentile_basis = st.radio(
+    "Percentiles measured against",
+    ["Players in the current filters", f"Fixed reference, same six-group with ≥ {engine.REFERENCE_MIN_MINUTES} minutes"],
+    horizontal=True,
+    help="With the fixed reference a player's percentiles, radar and Z score stay the same whatever the filters"
+)
+reference_minutes = None if percentile_basis.startswith("Players") else engine.REFERENCE_MIN_MINUTES
+
+pool_template = st.session_state.get("selected_template") or list(position_metrics.keys())[0]
+start_cache_warming(
+    (file_id, min_minutes, age_range, tuple(selected_leagues), reference_minutes),
+    [(file_id, base_df, min_minutes, age_range, (), tuple(selected_leagues), pool_template, reference_minutes)]
+    + [(file_id, base_df, min_minutes, age_range, (g,), tuple(selected_leagues), DEFAULT_TEMPLATE[g], reference_minutes) for g in available_groups]
+)
+
+# Population before Essential Criteria, identifies its cached percentile matrix
+pool_fingerprint = filter_fingerprint(min_minutes, age_range, tuple(selected_groups), tuple(selected_leagues))
+
 # Track if exactly one group is selected
 current_single_group = selected_groups[0] if len(selected_groups) == 1 else None
 
@@ -624,10 +360,6 @@ if current_single_group is not None and current_single_group != st.session_state
 # ---------- Build metric pool for Essential Criteria (needs current template) ----------
 current_template_name = st.session_state.selected_template or list(position_metrics.keys())[0]
 current_metrics = position_metrics[current_template_name]["metrics"]
-for m in current_metrics:
-    if m not in df.columns:
-        df[m] = 0
-df[current_metrics] = df[current_metrics].fillna(0)
 
 # ---------- Essential Criteria (multiple AND rules) ----------
 with st.expander("Essential Criteria", expanded=False):
@@ -636,116 +368,90 @@ with st.expander("Essential Criteria", expanded=False):
         value=False,
         help="Unchecked, only metrics in the selected template are shown"
     )
-    numeric_cols_all = sorted([c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])])
+    pool_matrix, matrix_cols = numeric_matrix(file_id, base_df)
+    numeric_cols_all = sorted(matrix_cols)
     metric_pool_base = numeric_cols_all if use_all_cols else current_metrics
 
-    cbtn1, cbtn2, cbtn3 = st.columns(3)
+    cbtn1, cbtn2 = st.columns(2)
     with cbtn1:
         if st.button("Add criterion"):
             st.session_state.ec_rows += 1
     with cbtn2:
         if st.button("Remove last", disabled=st.session_state.ec_rows <= 1):
             st.session_state.ec_rows = max(1, st.session_state.ec_rows - 1)
-    with cbtn3:
-        apply_nonneg = st.checkbox("Apply all criteria", value=False)
 
     if len(metric_pool_base) == 0:
         st.info("No numeric metrics available to filter.")
-        apply_nonneg = False
         st.session_state.ec_rows = 1
 
-    criteria = []
-    for i in range(st.session_state.ec_rows):
-        st.markdown(f"**Criterion {i+1}**")
-        c1, c2, c3, c4 = st.columns([3, 2, 2, 3])
-
-        prev_key_metric = f"ec_metric_{i}"
-        prev_metric = st.session_state.get(prev_key_metric, None)
-        metric_pool_display = list(metric_pool_base)
-        # Keep previous metric visible even if pool changed (prevents jumpiness)
-        if prev_metric and prev_metric not in metric_pool_display and prev_metric in numeric_cols_all:
-            metric_pool_display = [prev_metric] + [m for m in metric_pool_display if m != prev_metric]
-
-        with c1:
-            metric_name = st.selectbox("Metric", metric_pool_display, key=prev_key_metric)
-
-        with c2:
-            mode = st.radio("Apply to", ["Raw", "Percentile"], horizontal=True, key=f"ec_mode_{i}")
-
-        with c3:
-            op = st.selectbox("Operator", [">=", ">", "<=", "<"], index=0, key=f"ec_op_{i}")
-
-        with c4:
-            if mode == "Percentile":
-                default_thr = 50.0
-            else:
-                default_thr = float(np.nanmedian(pd.to_numeric(df[metric_name], errors="coerce")))
-                if not np.isfinite(default_thr):
-                    default_thr = 0.0
-            thr_str = st.text_input("Threshold", value=str(int(default_thr)), key=f"ec_thr_{i}")
-            try:
-                thr_val = float(thr_str)
-            except ValueError:
-                thr_val = default_thr
-
-        criteria.append((metric_name, mode, op, thr_val))
+    # Edits inside the form stay in the browser until "Apply", so typing a
+    # threshold no longer reruns the whole page on every keystroke
+    with st.form("essential_criteria", border=False):
+        criteria = []
+        for i in range(st.session_state.ec_rows):
+            st.markdown(f"**Criterion {i+1}**")
+            c1, c2, c3, c4 = st.columns([3, 2, 2, 3])
+
+            prev_key_metric = f"ec_metric_{i}"
+            prev_metric = st.session_state.get(prev_key_metric, None)
+            metric_pool_display = list(metric_pool_base)
+            # Keep previous metric visible even if pool changed (prevents jumpiness)
+            if prev_metric and prev_metric not in metric_pool_display and prev_metric in numeric_cols_all:
+                metric_pool_display = [prev_metric] + [m for m in metric_pool_display if m != prev_metric]
+
+            with c1:
+                metric_name = st.selectbox("Metric", metric_pool_display, key=prev_key_metric)
+
+            with c2:
+                mode = st.radio("Apply to", ["Raw", "Percentile"], horizontal=True, key=f"ec_mode_{i}")
+
+            with c3:
+                op = st.selectbox("Operator", [">=", ">", "<=", "<"], index=0, key=f"ec_op_{i}")
+
+            with c4:
+                if mode == "Percentile":
+                    default_thr = 50.0
+                else:
+                    default_thr = float(np.nanmedian(pool_matrix[pool_rows, matrix_cols[metric_name]]))
+                    if not np.isfinite(default_thr):
+                        default_thr = 0.0
+                thr_str = st.text_input("Threshold", value=str(int(default_thr)), key=f"ec_thr_{i}")
+                try:
+                    thr_val = float(thr_str)
+                except ValueError:
+                    thr_val = default_thr
+
+            criteria.append((metric_name, mode, op, thr_val))
 
-    if apply_nonneg and len(criteria) > 0:
-        temp_cols = []
-        mask_all = pd.Series(True, index=df.index)
-
-        for metric_name, mode, op, thr_val in criteria:
-            if mode == "Percentile":
-                df[metric_name] = pd.to_numeric(df[metric_name], errors="coerce")
-                perc_series = (df[metric_name].rank(pct=True) * 100).round(1)
-                tmp_col = f"__tmp_percentile__{metric_name}"
-                df[tmp_col] = perc_series
-                filter_col = tmp_col
-                temp_cols.append(tmp_col)
-            else:
-                filter_col = metric_name
-                df[filter_col] = pd.to_numeric(df[filter_col], errors="coerce")
-
-            if op == ">=":
-                mask = df[filter_col] >= thr_val
-            elif op == ">":
-                mask = df[filter_col] > thr_val
-            elif op == "<=":
-                mask = df[filter_col] <= thr_val
-            else:
-                mask = df[filter_col] < thr_val
-
-            mask_all &= mask
+        apply_nonneg = st.checkbox("Apply all criteria", value=False)
+        st.form_submit_button("Apply")
+    if len(metric_pool_base) == 0:
+        apply_nonneg = False
 
+    if apply_nonneg and len(criteria) > 0:
+        with diag.stage("criteria"):
+            mask_all, kept_per_criterion = criteria_mask(file_id, pool_fingerprint, tuple(criteria), current_template_name, base_df, pool_rows)
         kept = int(mask_all.sum())
         dropped = int((~mask_all).sum())
-        df = df[mask_all].copy()
-
-        if temp_cols:
-            df.drop(columns=temp_cols, inplace=True, errors="ignore")
 
         summary = " AND ".join(
             [f"{m} {o} {t}{'%' if md=='Percentile' else ''}" for m, md, o, t in criteria]
         )
         st.caption(f"Essential Criteria applied: {summary}. Kept {kept}, removed {dropped} players.")
+        for (m, md, o, t), k in zip(criteria, kept_per_criterion):
+            st.caption(f"{m} {o} {t}{'%' if md=='Percentile' else ''}, on its own kept {int(k)}, removed {len(pool_rows) - int(k)}.")
+        pool_rows = pool_rows[mask_all]
 
-# ---------- Player select (after EC). Changing player NEVER changes template ----------
-players = df["Player"].dropna().unique().tolist()
+# Population the chart and ranking are measured against
+chart_fingerprint = filter_fingerprint(pool_fingerprint, (tuple(criteria), current_template_name) if apply_nonneg else (), reference_minutes)
+
+# ---------- Players after EC ----------
+with diag.stage("player_index"):
+    player_keys, players, player_labels, player_positions, player_option_index = player_index(file_id, chart_fingerprint, base_df, pool_rows)
 if not players:
     st.warning("No players available after filters.")
     st.stop()
 
-if st.session_state.selected_player not in players:
-    st.session_state.selected_player = players[0]
-
-selected_player = st.selectbox(
-    "Choose a player",
-    players,
-    index=players.index(st.session_state.selected_player) if st.session_state.selected_player in players else 0,
-    key="player_select"
-)
-st.session_state.selected_player = selected_player
-
 # ---------- Template select (user-controlled). Only auto-snaps when single-group changes ----------
 template_names = list(position_metrics.keys())
 tpl_index = template_names.index(st.session_state.selected_template) if st.session_state.selected_template in template_names else 0
@@ -757,126 +463,216 @@ selected_position_template = st.selectbox(
 )
 st.session_state.selected_template = selected_position_template
 
-# ---------- Metrics for selected template, then percentiles ----------
-metrics = position_metrics[selected_position_template]["metrics"]
+# ---------- Score the selected template ----------
 metric_groups = position_metrics[selected_position_template]["groups"]
-
-# Ensure columns exist + fill
-for m in metrics:
-    if m not in df.columns:
-        df[m] = 0
-df[metrics] = df[metrics].fillna(0)
-
-metrics_df = df[metrics].copy()
-percentile_df = (metrics_df.rank(pct=True) * 100).round(1)
-
-keep_cols = ["Player", "Team within selected timeframe", "Team", "Age", "Height", "Positions played", "Minutes played"]
-for c in keep_cols:
-    if c not in df.columns:
-        df[c] = np.nan
-
-plot_data = pd.concat([df[keep_cols], metrics_df, percentile_df.add_suffix(" (percentile)")], axis=1)
-
-sel_metrics = list(metric_groups.keys())
-percentiles_all = plot_data[[m + " (percentile)" for m in sel_metrics]]
-z_scores_all = (percentiles_all - 50) / 15
-plot_data["Avg Z Score"] = z_scores_all.mean(axis=1)
-plot_data["Rank"] = plot_data["Avg Z Score"].rank(ascending=False, method="min").astype(int)
-
-# ---------- Chart ----------
-def plot_radial_bar_grouped(player_name, plot_data, metric_groups, group_colors):
-    row = plot_data[plot_data["Player"] == player_name]
-    if row.empty:
-        st.error(f"No player named '{player_name}' found.")
-        return
-
-    sel_metrics_loc = list(metric_groups.keys())
-    raw = row[sel_metrics_loc].values.flatten()
-    percentiles = row[[m + " (percentile)" for m in sel_metrics_loc]].values.flatten()
-    groups = [metric_groups[m] for m in sel_metrics_loc]
-    colors = [group_colors.get(g, "grey") for g in groups]
-
-    num_bars = len(sel_metrics_loc)
-    angles = np.linspace(0, 2*np.pi, num_bars, endpoint=False)
-
-    fig, ax = plt.subplots(figsize=(10, 10), subplot_kw=dict(polar=True))
-    fig.patch.set_facecolor("white")
-    ax.set_facecolor("white")
-    ax.set_theta_offset(np.pi/2)
-    ax.set_theta_direction(-1)
-    ax.set_ylim(0, 100)
-    ax.set_yticklabels([])
-    ax.set_xticks([])
-    ax.spines["polar"].set_visible(False)
-
-    ax.bar(angles, percentiles, width=2*np.pi/num_bars*0.9, color=colors, edgecolor=colors, alpha=0.75)
-
-    for angle, raw_val in zip(angles, raw):
-        ax.text(angle, 50, f"{raw_val:.2f}", ha="center", va="center", color="black", fontsize=10, fontweight="bold")
-
-    for i, angle in enumerate(angles):
-        label = sel_metrics_loc[i].replace(" per 90", "").replace(", %", " (%)")
-        ax.text(angle, 108, label, ha="center", va="center", color="black", fontsize=10, fontweight="bold")
-
-    group_positions = {}
-    for g, a in zip(groups, angles):
-        group_positions.setdefault(g, []).append(a)
-    for group, group_angles in group_positions.items():
-        mean_angle = np.mean(group_angles)
-        ax.text(mean_angle, 125, group, ha="center", va="center", fontsize=20, fontweight="bold", color=group_colors.get(group, "grey"))
-
-    age = row["Age"].values[0]
-    height = row["Height"].values[0]
-    team = row["Team within selected timeframe"].values[0]
-    mins = row["Minutes played"].values[0] if "Minutes played" in row else np.nan
-    rank_val = int(row["Rank"].values[0]) if "Rank" in row else None
-
-    age_str = f"{int(age)} years old" if not pd.isnull(age) else ""
-    height_str = f"{int(height)} cm" if not pd.isnull(height) else ""
-    parts = [player_name]
-    if age_str: parts.append(age_str)
-    if height_str: parts.append(height_str)
-    line1 = " | ".join(parts)
-
-    team_str = f"{team}" if pd.notnull(team) else ""
-    mins_str = f"{int(mins)} mins" if pd.notnull(mins) else ""
-    rank_str = f"Rank #{rank_val}" if rank_val is not None else ""
-    line2 = " | ".join([p for p in [team_str, mins_str, rank_str] if p])
-
-    ax.set_title(f"{line1}\n{line2}", color="black", size=22, pad=20, y=1.12)
-
-    z_scores = (percentiles - 50) / 15
-    avg_z = np.mean(z_scores)
-
-    if avg_z >= 1.0:
-        badge = ("Excellent", "#228B22")
-    elif avg_z >= 0.3:
-        badge = ("Good", "#1E90FF")
-    elif avg_z >= -0.3:
-        badge = ("Average", "#DAA520")
-    else:
-        badge = ("Below Average", "#DC143C")
-
-    st.markdown(
-        f"<div style='text-align:center; margin-top: 20px;'>"
-        f"<span style='font-size:24px; font-weight:bold;'>Average Z Score, {avg_z:.2f}</span><br>"
-        f"<span style='background-color:{badge[1]}; color:white; padding:5px 10px; border-radius:8px; font-size:20px;'>{badge[0]}</span></div>",
-        unsafe_allow_html=True
+with diag.stage("percentile_score"):
+    plot_data = score_players(file_id, chart_fingerprint, selected_position_template, reference_minutes, base_df, pool_rows)
+
+# ---------- Player view: select, chart, role fit, similar players ----------
+RADAR_CACHE_MAX_BYTES = 64 * 1024 * 1024  # shared by all sessions, least recently viewed evicted first
+
+@st.cache_resource
+def radar_image_cache() -> RadarImageCache:
+    return RadarImageCache(RADAR_CACHE_MAX_BYTES)
+
+@diagnostics.count_calls
+def radar_image(player_key, player_row, metric_groups, group_colors, cache_key):
+    key = (cache_key, player_key, tuple(group_colors.items()), RADAR_IMAGE_FORMAT)
+    cache = radar_image_cache()
+    image = cache.get(key)
+    if image is None:
+        diagnostics.count_miss("radar_image")
+        image = render_radar(player_row, metric_groups, group_colors)
+        cache.put(key, image)
+    return image
+
+# A fragment: choosing a player (select box or similar-players table) reruns
+# only this section. Changing player NEVER changes template.
+@st.fragment
+def player_view():
+    # A full rerun records into its own recorder; a fragment-only rerun gets a
+    # fresh one and writes its own trace line
+    fragment_rerun = bool(get_script_run_ctx().fragment_ids_this_run)
+    view_diag = diagnostics.StageRecorder(diagnostics_on) if fragment_rerun else diag
+
+    # A row picked in the ranking or similar-players table (previous run) becomes
+    # the selected player
+    for table_key, keys_key in (
+        (st.session_state.get("ranking_table_key"), "ranking_keys"),
+        (st.session_state.get("similar_table_key"), "similar_keys"),
+    ):
+        table_selection = st.session_state.get(table_key) if table_key else None
+        if table_selection is not None and table_selection.selection.rows:
+            picked_row = table_selection.selection.rows[0]
+            table_keys = st.session_state.get(keys_key, [])
+            if picked_row < len(table_keys) and (picked_row, table_keys[picked_row]) != st.session_state.get(f"{keys_key}_picked"):
+                st.session_state[f"{keys_key}_picked"] = (picked_row, table_keys[picked_row])
+                st.session_state.selected_player = table_keys[picked_row]
+                st.session_state.pop("player_select", None)
+
+    if st.session_state.selected_player not in player_option_index:
+        st.session_state.selected_player = players[0]
+
+    selected_player = st.selectbox(
+        "Choose a player",
+        players,
+        index=player_option_index[st.session_state.selected_player],
+        format_func=lambda k: player_labels.get(k, k),
+        key="player_select"
     )
+    st.session_state.selected_player = selected_player
+
+    if st.session_state.selected_player:
+        player_row = plot_data.iloc[[player_positions[st.session_state.selected_player]]]
+        player_percentiles = player_row[[m + " (percentile)" for m in metric_groups]].values.flatten()
+        avg_z = np.mean((player_percentiles - 50) / 15)
+        badge = z_score_badge(avg_z)
+
+        st.markdown(
+            f"<div style='text-align:center; margin-top: 20px;'>"
+            f"<span style='font-size:24px; font-weight:bold;'>Average Z Score, {avg_z:.2f}</span><br>"
+            f"<span style='background-color:{badge[1]}; color:white; padding:5px 10px; border-radius:8px; font-size:20px;'>{badge[0]}</span></div>",
+            unsafe_allow_html=True
+        )
+
+        with view_diag.stage("render"):
+            radar = radar_image(
+                st.session_state.selected_player, player_row, metric_groups, group_colors,
+                cache_key=(file_id, chart_fingerprint, selected_position_template)
+            )
+            st.image(radar, use_container_width=True)
+
+    # Role fit across templates
+    with st.expander("Role fit across all templates", expanded=False):
+        with view_diag.stage("role_fit"):
+            fit, best_role = role_fit(file_id, chart_fingerprint, reference_minutes, base_df, pool_rows)
+        selected_pos = player_positions[st.session_state.selected_player]
+        st.markdown(f"**{player_labels[st.session_state.selected_player]}**, best role {best_role['Best role'].iloc[selected_pos]}")
+        player_fit = fit.iloc[selected_pos].sort_values(ascending=False).round(2)
+        st.dataframe(
+            player_fit.rename("Avg Z Score").rename_axis("Template").reset_index(),
+            hide_index=True, use_container_width=True
+        )
+        if st.checkbox("Show every player's fit", value=False):
+            role_table = pd.concat([base_df[["Player", "Team", "Positions played"]].iloc[pool_rows], best_role, fit], axis=1)
+            st.dataframe(
+                role_table.sort_values("Best Avg Z Score", ascending=False).round(2),
+                hide_index=True, use_container_width=True
+            )
+
+    # Similar players
+    with st.expander("Players with a similar profile", expanded=False):
+        s1, s2 = st.columns(2)
+        with s1:
+            similar_measure = st.radio("Measure", ["Cosine", "Euclidean"], horizontal=True, help="Over the template's percentiles, centred on 50")
+        with s2:
+            similar_n = st.number_input("Players to show", min_value=1, max_value=100, value=10, step=5)
+        with view_diag.stage("similar"):
+            similar_pos, similar_values = engine.similar_players(
+                similarity_index(file_id, chart_fingerprint, selected_position_template, reference_minutes, base_df, pool_rows),
+                player_positions[st.session_state.selected_player], int(similar_n), similar_measure.lower()
+            )
+        similar_table = plot_data.iloc[similar_pos][["Player", "Team", "Positions played", "Age", "Minutes played", "Avg Z Score", "Player key"]].reset_index(drop=True)
+        similar_table.insert(1, "Similarity" if similar_measure == "Cosine" else "Distance", np.round(similar_values, 3))
+        similar_table.index = np.arange(1, len(similar_table) + 1)
+
+        # Keyed on the query player, so a pick starts the next table unselected
+        st.session_state.similar_keys = similar_table["Player key"].tolist()
+        st.session_state.similar_table_key = f"similar_table_{filter_fingerprint(st.session_state.selected_player, selected_position_template)}"
+        st.caption("Pick a row to show that player's radar.")
+        st.dataframe(
+            similar_table, use_container_width=True,
+            column_config={"Player key": None},
+            on_select="rerun", selection_mode="single-row", key=st.session_state.similar_table_key
+        )
 
-    st.pyplot(fig, use_container_width=True)
+    if fragment_rerun and diagnostics_on:
+        view_diag.append_trace(
+            session=st.session_state.setdefault("diagnostics_session", os.urandom(4).hex()),
+            file=file_id[:12], scope="player_view", players=len(pool_rows), template=selected_position_template,
+        )
 
-if st.session_state.selected_player:
-    plot_radial_bar_grouped(st.session_state.selected_player, plot_data, metric_groups, group_colors)
+player_view()
 
 # ---------- Ranking table ----------
+RANKING_PAGE_SIZE = 50
+
 st.markdown("### Players Ranked by Z-Score")
-cols_for_table = ["Player", "Positions played", "Age", "Team", "Team within selected timeframe", "Minutes played", "Avg Z Score", "Rank"]
-z_ranking = (plot_data[cols_for_table].sort_values(by="Avg Z Score", ascending=False).reset_index(drop=True))
-z_ranking[["Team", "Team within selected timeframe"]] = z_ranking[["Team", "Team within selected timeframe"]].fillna("N/A")
-if "Age" in z_ranking:
-    z_ranking["Age"] = z_ranking["Age"].apply(lambda x: int(x) if pd.notnull(x) else x)
-z_ranking.index = np.arange(1, len(z_ranking) + 1)
-z_ranking.index.name = "Row"
-
-st.dataframe(z_ranking, use_container_width=True)
+r1, r2 = st.columns(2)
+with r1:
+    ranking_top_k = st.number_input(
+        "Players to rank (from the top)", min_value=1, max_value=len(plot_data),
+        value=min(RANKING_DEFAULT_TOP_K, len(plot_data)), step=50
+    )
+# Only the top K are sorted, and only one page of them goes to the browser
+with diag.stage("rank"):
+    z_ranking = rank_players(file_id, chart_fingerprint, selected_position_template, int(ranking_top_k), plot_data)
+ranking_pages = max(1, -(-len(z_ranking) // RANKING_PAGE_SIZE))
+with r2:
+    ranking_page = st.number_input(f"Page (of {ranking_pages})", min_value=1, max_value=ranking_pages, value=1, step=1)
+ranking_page_rows = z_ranking.iloc[(ranking_page - 1) * RANKING_PAGE_SIZE:ranking_page * RANKING_PAGE_SIZE]
+
+# Table rows resolve to players through their key; picking one shows its radar.
+# Keyed per view and page, so a pick never carries over to other rows.
+st.session_state.ranking_keys = ranking_page_rows["Player key"].tolist()
+st.session_state.ranking_table_key = f"ranking_table_{filter_fingerprint(chart_fingerprint, selected_position_template, ranking_top_k, ranking_page)}"
+with diag.stage("table"):
+    st.dataframe(
+        ranking_page_rows, use_container_width=True,
+        column_config={"Player key": None},
+        on_select="rerun", selection_mode="single-row", key=st.session_state.ranking_table_key
+    )
+
+# ---------- Bulk radar export ----------
+with st.expander("Export radars for this ranking", expanded=False):
+    e1, e2 = st.columns(2)
+    with e1:
+        export_top_k = st.number_input(
+            "Players to export (from the top)", min_value=1, max_value=len(plot_data),
+            value=min(50, len(plot_data)), step=10
+        )
+    with e2:
+        export_format = st.radio("Format", ["ZIP of PNGs", "Multi-page PDF"], horizontal=True)
+
+    # Reuses the cached scores; workers only receive the rows they draw
+    export_key = (file_id, chart_fingerprint, selected_position_template, int(export_top_k), export_format)
+    if st.button("Render radars"):
+        ranked_keys = rank_players(file_id, chart_fingerprint, selected_position_template, int(export_top_k), plot_data)["Player key"]
+        player_rows = [plot_data.iloc[[player_positions[k]]] for k in ranked_keys]
+        progress = st.progress(0.0, text="Rendering radars...")
+        with diag.stage("export"):
+            images = render_radars_parallel(
+                player_rows, metric_groups, group_colors,
+                on_progress=lambda done, total: progress.progress(done / total, text=f"Rendered {done} of {total} radars")
+            )
+        export_name = re.sub(r"[^\w\-]+", "_", selected_position_template).strip("_")
+        if export_format == "ZIP of PNGs":
+            names = [row["Player"].iloc[0] for row in player_rows]
+            st.session_state.radar_export = (export_key, radars_to_zip(names, images), f"radars_{export_name}.zip", "application/zip")
+        else:
+            st.session_state.radar_export = (export_key, radars_to_pdf(images), f"radars_{export_name}.pdf", "application/pdf")
+        progress.empty()
+
+    radar_export = st.session_state.get("radar_export")
+    if radar_export and radar_export[0] == export_key:
+        st.download_button("Download radars", data=radar_export[1], file_name=radar_export[2], mime=radar_export[3])
+
+# ---------- Diagnostics panel ----------
+if diagnostics_on:
+    with st.expander("Diagnostics, this rerun", expanded=False):
+        stage_table = pd.DataFrame(diag.stages)
+        stage_table = stage_table.groupby("stage", sort=False).agg(
+            calls=("seconds", "size"), seconds=("seconds", "sum"), peak_mb=("peak_bytes", "max")
+        )
+        stage_table["ms"] = (stage_table.pop("seconds") * 1000).round(1)
+        stage_table["peak_mb"] = (stage_table["peak_mb"] / 2**20).round(2)
+        st.dataframe(stage_table[["calls", "ms", "peak_mb"]], use_container_width=True)
+
+        cache_counts = diag.cache_counts()
+        if cache_counts:
+            st.dataframe(pd.DataFrame(cache_counts).T.rename_axis("cached function"), use_container_width=True)
+        st.caption(f"{len(pool_rows)} players in the pool, {len(base_df)} rows in the file. Trace appended to {diagnostics.TRACE_PATH}")
+    diag.append_trace(
+        session=st.session_state.setdefault("diagnostics_session", os.urandom(4).hex()),
+        file=file_id[:12], rows=len(base_df), players=len(pool_rows), template=selected_position_template,
+    )
@@ -0,0 +1,193 @@
+# Times every pipeline stage on synthetic exports and writes JSON, so runs from
+# different versions can be compared. From the repo root:
+#   python -m benchmarks.run_benchmarks --rows 500 5000 100000 --output bench.json
+#   python -m benchmarks.run_benchmarks --rows 5000 --compare bench.json
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+import engine
+import charts
+import league_store
+from benchmarks.synthetic import synthetic_export, export_bytes, workbook_bytes
+
+BENCH_CRITERIA = (
+    ("Minutes played", "Raw", ">=", 900.0),
+    ("xG per 90", "Percentile", ">=", 60.0),
+    ("Accurate passes, %", "Raw", ">", 70.0),
+)
+BENCH_TEMPLATE = "Striker, All Round CF"
+
+def _time(fn, repeats: int):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def bench_rows(rows: int, repeats: int, formats, xlsx_max_rows: int, radar_renders: int):
+    results = []
+
+    def record(stage, fn, n_repeats=repeats, **extra):
+        times = _time(fn, n_repeats)
+        results.append({
+            "stage": stage, "rows": rows, "repeats": n_repeats,
+            "seconds_min": min(times), "seconds_median": statistics.median(times), **extra,
+        })
+
+    raw = synthetic_export(rows)
+
+    # Ingest, per upload format (sidecars go to a throwaway directory, restored after)
+    sidecar_dir_before = engine.SIDECAR_DIR
+    try:
+        with tempfile.TemporaryDirectory() as sidecar_dir:
+            engine.SIDECAR_DIR = sidecar_dir
+            for file_type in formats:
+                if file_type == "xlsx" and rows > xlsx_max_rows:
+                    continue
+                data = export_bytes(raw, file_type)
+                if file_type == "xlsx":
+                    # Cold parse uses a fresh digest each time so the sidecar never hits
+                    counter = iter(range(repeats * 2))
+                    record("ingest_xlsx_cold", lambda: engine.load_dataset(data, "xlsx", f"cold-{next(counter)}"), bytes=len(data))
+                    engine.load_dataset(data, "xlsx", "warm")
+                    record("ingest_xlsx_sidecar", lambda: engine.load_dataset(data, "xlsx", "warm"), bytes=len(data))
+                    # The same rows as a 4-sheet workbook: one process, then the sheet pool
+                    book = workbook_bytes(raw, 4)
+                    record("ingest_xlsx_sheets_serial", lambda: engine.read_workbook(book, 1), bytes=len(book), sheets=4)
+                    record("ingest_xlsx_sheets_parallel", lambda: engine.read_workbook(book, parallel_min_bytes=0), bytes=len(book), sheets=4, workers=engine.EXCEL_SHEET_WORKERS)
+                else:
+                    record(f"ingest_{file_type}", lambda: engine.load_dataset(data, file_type), bytes=len(data))
+            # A session attaching to a file another session already published
+            data = export_bytes(raw, "parquet")
+            shared_base = engine.load_shared_dataset(data, "parquet", "shared")[0]
+            record("dataset_attach", lambda: engine.attach_dataset("shared"))
+            # League store: two league partitions, one read back with every filter pushed down
+            store_dir = f"{sidecar_dir}/store"
+            for league in ("A", "B"):
+                league_store.append(shared_base, league, "2024", store_dir)
+            record("store_query_pushdown", lambda: league_store.query(["A"], (), 1000, (20, 29), ("Central Forward",), store_dir=store_dir))
+    finally:
+        engine.SIDECAR_DIR = sidecar_dir_before
+
+    base, _ = engine.prepare_frame(raw.copy())
+
+    # Position mapping: the scalar function row by row, and the vectorized stage
+    positions = raw["Position"]
+    record("map_first_position_to_group", lambda: positions.map(engine.map_first_position_to_group))
+    record("map_positions_to_groups", lambda: engine.map_positions_to_groups(positions))
+
+    # Filters, one at a time and combined
+    record("filter_minutes", lambda: engine.filter_rows(base, 1000))
+    record("filter_age", lambda: engine.filter_rows(base, 0, (20, 29)))
+    record("filter_six_group", lambda: engine.filter_rows(base, 0, None, ("Central Forward",)))
+    pool_rows = engine.filter_rows(base, 900)
+    # Filters that leave nobody: the whole pipeline on an empty population
+    record("run_pipeline_empty", lambda: engine.run_pipeline(base, BENCH_TEMPLATE, min_minutes=10**9))
+
+    numeric = engine.numeric_matrix(base)
+    record("numeric_matrix", lambda: engine.numeric_matrix(base))
+    record("essential_criteria", lambda: engine.criteria_mask(base, pool_rows, BENCH_CRITERIA, numeric, BENCH_TEMPLATE), criteria=len(BENCH_CRITERIA))
+
+    record("percentile_matrix", lambda: engine.percentile_matrix(base, pool_rows, numeric), metrics=len(engine.ALL_TEMPLATE_METRICS))
+    percentiles = engine.percentile_matrix(base, pool_rows, numeric)
+    record("reference_index", lambda: engine.reference_index(base, engine.REFERENCE_MIN_MINUTES, numeric))
+    reference = engine.reference_index(base, engine.REFERENCE_MIN_MINUTES, numeric)
+    record("reference_percentiles", lambda: engine.reference_percentiles(base, pool_rows, reference, numeric), metrics=len(engine.ALL_TEMPLATE_METRICS))
+    player_keys = engine.player_index(base, pool_rows)[0]
+    record("player_index", lambda: engine.player_index(base, pool_rows))
+    record("score_zscore_rank", lambda: engine.score_players(base, pool_rows, BENCH_TEMPLATE, percentiles, player_keys))
+    plot_data = engine.score_players(base, pool_rows, BENCH_TEMPLATE, percentiles, player_keys)
+    record("ranking_table", lambda: engine.rank_players(plot_data))
+    record("ranking_table_top200", lambda: engine.rank_players(plot_data, 200))
+    record("role_fit", lambda: engine.role_fit(percentiles), templates=len(engine.position_metrics))
+    similarity = engine.similarity_index(percentiles, BENCH_TEMPLATE)
+    record("similarity_index", lambda: engine.similarity_index(percentiles, BENCH_TEMPLATE))
+    if len(pool_rows) > 1:
+        record("similar_players_query", lambda: engine.similar_players(similarity, 0, 10))
+
+    # Radar rendering does not depend on row count; time a handful of players
+    metric_groups = engine.position_metrics[BENCH_TEMPLATE]["groups"]
+    sample = [plot_data.iloc[[i]] for i in range(min(radar_renders, len(plot_data)))]
+    if sample:
+        record(
+            "radar_render",
+            lambda: [charts.figure_to_bytes(charts.plot_radial_bar_grouped(row, metric_groups, charts.group_colors)) for row in sample],
+            n_repeats=1, players=len(sample),
+        )
+        charts.radar_layer(metric_groups, charts.group_colors)
+        record(
+            "radar_render_layer",
+            lambda: [charts.render_radar(row, metric_groups, charts.group_colors) for row in sample],
+            n_repeats=1, players=len(sample),
+        )
+    return results
+
+def compare(current, previous):
+    old = {(r["stage"], r["rows"]): r["seconds_min"] for r in previous["results"]}
+    print(f"{'stage':32} {'rows':>8} {'before':>10} {'after':>10} {'ratio':>7}")
+    for r in current["results"]:
+        before = old.get((r["stage"], r["rows"]))
+        if before is None:
+            continue
+        ratio = r["seconds_min"] / before if before else float("inf")
+        flag = "  slower" if ratio > 1.2 else ""
+        print(f"{r['stage']:32} {r['rows']:>8} {before:>10.4f} {r['seconds_min']:>10.4f} {ratio:>7.2f}{flag}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark each radar pipeline stage on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[500, 5000, 20000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet", "feather", "xlsx"], choices=engine.UPLOAD_TYPES)
+    parser.add_argument("--xlsx-max-rows", type=int, default=20000, help="Skip the (slow) Excel ingest above this size")
+    parser.add_argument("--radar-renders", type=int, default=5)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Earlier JSON output to compare against")
+    args = parser.parse_args(argv)
+
+    matplotlib.use("Agg")
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "matplotlib": matplotlib.__version__,
+            "platform": platform.platform(),
+        },
+        "results": [],
+    }
+    for rows in args.rows:
+        report["results"].extend(bench_rows(rows, args.repeats, args.formats, args.xlsx_max_rows, args.radar_renders))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(report, json.load(fh))
+    elif not args.output:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+# Wyscout-shaped synthetic exports for benchmarking: every column the templates
+# reference, realistic Position strings, minutes and ages, at any row count.
+import io
+
+import numpy as np
+import pandas as pd
+
+import engine
+
+POSITION_STRINGS = [
+    "GK", "CB", "LCB", "RCB", "LCB, CB", "RCB, RB", "LB", "RB", "LWB", "RWB", "LB, LWB",
+    "DMF", "LDMF, DMF", "RDMF", "LCMF", "RCMF, CMF", "AMF", "AMF, CF", "LAMF", "RAMF, RW",
+    "LW", "RW", "LWF, LW", "RWF", "CF", "CF, SS", "CF / LWF", "ST",
+]
+TEAMS = [f"Club {i:03d}" for i in range(120)]
+
+def synthetic_export(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Player": [f"Player {i}" for i in rng.integers(0, max(1, int(rows * 0.97)), rows)],
+        "Team": rng.choice(TEAMS, rows),
+        "Team within selected timeframe": rng.choice(TEAMS, rows),
+        "Position": rng.choice(POSITION_STRINGS, rows),
+        "Age": rng.integers(16, 40, rows),
+        "Height": rng.normal(181, 7, rows).round(),
+        "Minutes played": rng.gamma(2.0, 700.0, rows).round().clip(0, 4500),
+    })
+    for m in engine.ALL_TEMPLATE_METRICS:
+        if m.endswith(", %"):
+            df[m] = rng.uniform(0, 100, rows).round(1)
+        else:
+            df[m] = rng.gamma(1.5, 1.2, rows).round(2)
+    return df
+
+def export_bytes(df: pd.DataFrame, file_type: str) -> bytes:
+    buf = io.BytesIO()
+    if file_type == "csv":
+        df.to_csv(buf, index=False)
+    elif file_type == "parquet":
+        df.to_parquet(buf, index=False)
+    elif file_type in ("feather", "arrow"):
+        df.to_feather(buf)
+    elif file_type == "xlsx":
+        df.to_excel(buf, index=False)
+    else:
+        raise ValueError(f"unsupported file type {file_type!r}")
+    return buf.getvalue()
+
+def workbook_bytes(df: pd.DataFrame, sheets: int) -> bytes:
+    # The rows dealt round-robin over one sheet per competition
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf) as writer:
+        for i in range(sheets):
+            df.iloc[i::sheets].to_excel(writer, sheet_name=f"League {i + 1}", index=False)
+    return buf.getvalue()
@@ -0,0 +1,323 @@
+import io
+import os
+import re
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from engine import GROUP_COLORS
+
+RADAR_IMAGE_FORMAT = "png"
+# matplotlib is CPU-bound and not thread-safe, batch rendering uses processes
+RADAR_EXPORT_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))
+
+# ---------- Radar chart ----------
+# Colors, one per radar group, from the template file
+group_colors = dict(GROUP_COLORS)
+
+def plot_radial_bar_grouped(row, metric_groups, group_colors):
+    # row is the player's single plot_data row, already resolved by player key
+    sel_metrics_loc = list(metric_groups.keys())
+    raw = row[sel_metrics_loc].values.flatten()
+    percentiles = row[[m + " (percentile)" for m in sel_metrics_loc]].values.flatten()
+    groups = [metric_groups[m] for m in sel_metrics_loc]
+    colors = [group_colors.get(g, "grey") for g in groups]
+
+    num_bars = len(sel_metrics_loc)
+    angles = np.linspace(0, 2*np.pi, num_bars, endpoint=False)
+
+    fig, ax = plt.subplots(figsize=(10, 10), subplot_kw=dict(polar=True))
+    fig.patch.set_facecolor("white")
+    ax.set_facecolor("white")
+    ax.set_theta_offset(np.pi/2)
+    ax.set_theta_direction(-1)
+    ax.set_ylim(0, 100)
+    ax.set_yticklabels([])
+    ax.set_xticks([])
+    ax.spines["polar"].set_visible(False)
+    ax.set_axisbelow(True)  # grid under the bars, so a RadarLayer's background holds it
+
+    ax.bar(angles, percentiles, width=2*np.pi/num_bars*0.9, color=colors, edgecolor=colors, alpha=0.75)
+
+    for angle, raw_val in zip(angles, raw):
+        ax.text(angle, 50, f"{raw_val:.2f}", ha="center", va="center", color="black", fontsize=10, fontweight="bold")
+
+    for i, angle in enumerate(angles):
+        label = sel_metrics_loc[i].replace(" per 90", "").replace(", %", " (%)")
+        ax.text(angle, 108, label, ha="center", va="center", color="black", fontsize=10, fontweight="bold")
+
+    group_positions = {}
+    for g, a in zip(groups, angles):
+        group_positions.setdefault(g, []).append(a)
+    for group, group_angles in group_positions.items():
+        mean_angle = np.mean(group_angles)
+        ax.text(mean_angle, 125, group, ha="center", va="center", fontsize=20, fontweight="bold", color=group_colors.get(group, "grey"))
+
+    ax.set_title(_radar_title(row), color="black", size=22, pad=20, y=1.12)
+
+    return fig
+
+def _radar_title(row) -> str:
+    player_name = row["Player"].values[0]
+    age = row["Age"].values[0]
+    height = row["Height"].values[0]
+    team = row["Team within selected timeframe"].values[0]
+    mins = row["Minutes played"].values[0] if "Minutes played" in row else np.nan
+    rank_val = int(row["Rank"].values[0]) if "Rank" in row else None
+
+    age_str = f"{int(age)} years old" if not pd.isnull(age) else ""
+    height_str = f"{int(height)} cm" if not pd.isnull(height) else ""
+    parts = [player_name]
+    if age_str: parts.append(age_str)
+    if height_str: parts.append(height_str)
+    line1 = " | ".join(parts)
+
+    team_str = f"{team}" if pd.notnull(team) else ""
+    mins_str = f"{int(mins)} mins" if pd.notnull(mins) else ""
+    rank_str = f"Rank #{rank_val}" if rank_val is not None else ""
+    line2 = " | ".join([p for p in [team_str, mins_str, rank_str] if p])
+    return f"{line1}\n{line2}"
+
+# ---------- Precompiled radar layers ----------
+# Within a template only the bar heights, the raw-value texts and the title
+# change between players. A RadarLayer rasterises everything else once (axes
+# and grid, metric labels at 108, group headers at 125) and keeps just the
+# pixels of the chart's tight box, compressed. Per player those pixels go back
+# into the process's one shared canvas, the changing artists are drawn on top
+# and the box savefig would use is cropped out and encoded.
+RADAR_DPI = 200
+# matplotlib's text and font caches are shared, so layers draw one at a time;
+# encoding runs outside the lock
+_render_lock = threading.Lock()
+RADAR_CANVAS_INCHES = 14  # room around the 10in chart, so the title and headers never clip
+RADAR_PAD_INCHES = 0.1
+# Reserves room for the title: two lines, with a tall ascender and a deep descender
+RADAR_TITLE_PROBE = "Ág|\nÁg|"
+_renderer = None
+
+def _shared_renderer() -> RendererAgg:
+    # One canvas per process for every layer: text artists keep a reference to
+    # the renderer that last drew them, so a renderer per layer would stay alive
+    global _renderer
+    if _renderer is None:
+        side = RADAR_CANVAS_INCHES * RADAR_DPI
+        _renderer = RendererAgg(side, side, RADAR_DPI)
+    return _renderer
+
+class RadarLayer:
+    def __init__(self, metric_groups, group_colors):
+        self.metric_groups, self.group_colors = dict(metric_groups), dict(group_colors)
+        self.metrics = list(metric_groups.keys())
+        groups = [metric_groups[m] for m in self.metrics]
+        colors = [group_colors.get(g, "grey") for g in groups]
+        angles = np.linspace(0, 2*np.pi, len(self.metrics), endpoint=False)
+
+        # A bare Figure, not pyplot: nothing global to close. The axes get the
+        # same size in inches as plt.subplots(figsize=(10, 10)).
+        self.fig = Figure(figsize=(RADAR_CANVAS_INCHES, RADAR_CANVAS_INCHES), dpi=RADAR_DPI)
+        margin = (RADAR_CANVAS_INCHES - 10) / 2
+        ax = self.fig.add_axes([
+            (margin + 1.25) / RADAR_CANVAS_INCHES, (margin + 1.1) / RADAR_CANVAS_INCHES,
+            7.75 / RADAR_CANVAS_INCHES, 7.7 / RADAR_CANVAS_INCHES,
+        ], polar=True)
+        self.fig.patch.set_facecolor("white")
+        ax.set_facecolor("white")
+        ax.set_theta_offset(np.pi/2)
+        ax.set_theta_direction(-1)
+        ax.set_ylim(0, 100)
+        ax.set_yticklabels([])
+        ax.set_xticks([])
+        ax.spines["polar"].set_visible(False)
+        ax.set_axisbelow(True)
+
+        self.bars = ax.bar(angles, np.zeros(len(angles)), width=2*np.pi/len(angles)*0.9, color=colors, edgecolor=colors, alpha=0.75)
+        self.raw_texts = [
+            ax.text(angle, 50, "", ha="center", va="center", color="black", fontsize=10, fontweight="bold")
+            for angle in angles
+        ]
+        for metric, angle in zip(self.metrics, angles):
+            label = metric.replace(" per 90", "").replace(", %", " (%)")
+            ax.text(angle, 108, label, ha="center", va="center", color="black", fontsize=10, fontweight="bold")
+        group_positions = {}
+        for g, a in zip(groups, angles):
+            group_positions.setdefault(g, []).append(a)
+        for group, group_angles in group_positions.items():
+            ax.text(np.mean(group_angles), 125, group, ha="center", va="center", fontsize=20, fontweight="bold", color=group_colors.get(group, "grey"))
+        self.title = ax.set_title("", color="black", size=22, pad=20, y=1.12)
+
+        # Drawn per player, in the original stacking order: bars, texts, title
+        self.dynamic = [*self.bars, *self.raw_texts, self.title]
+        for artist in self.dynamic:
+            artist.set_animated(True)
+
+        with _render_lock:
+            renderer = _shared_renderer()
+            self.fig.draw(renderer)
+            self.static_extent = self.fig.get_tightbbox(renderer).transformed(self.fig.dpi_scale_trans)
+            # Kept pixels: the static layer plus room for any two-line title
+            self.title.set_text(RADAR_TITLE_PROBE)
+            box = Bbox.union([self.static_extent, self.title.get_window_extent(renderer)]).padded(RADAR_PAD_INCHES * RADAR_DPI + 1)
+            height = renderer.height
+            self.box = (
+                max(int(np.floor(height - box.y1)), 0), min(int(np.ceil(height - box.y0)), height),
+                max(int(np.floor(box.x0)), 0), min(int(np.ceil(box.x1)), renderer.width),
+            )
+            top, bottom, left, right = self.box
+            self.background = zlib.compress(np.asarray(renderer.buffer_rgba())[top:bottom, left:right].tobytes(), 1)
+
+    def render(self, row, fmt: str = RADAR_IMAGE_FORMAT) -> bytes:
+        raw = row[self.metrics].values.flatten()
+        percentiles = row[[m + " (percentile)" for m in self.metrics]].values.flatten()
+        with _render_lock:
+            self.title.set_text(_radar_title(row))
+            renderer = _shared_renderer()
+            # The box savefig would crop to, static layer plus this player's title,
+            # in savefig's image size (the padded box, truncated to whole pixels)
+            extent = Bbox.union([self.static_extent, self.title.get_window_extent(renderer)]).padded(RADAR_PAD_INCHES * RADAR_DPI)
+            x0, y0 = int(np.floor(extent.x0)), int(np.floor(renderer.height - extent.y1))
+            x1, y1 = x0 + int(extent.width), y0 + int(extent.height)
+            top, bottom, left, right = self.box
+            fits = left <= x0 and top <= y0 and x1 <= right and y1 <= bottom
+            if fits:
+                for bar, height in zip(self.bars, percentiles):
+                    bar.set_height(height)
+                for text, raw_val in zip(self.raw_texts, raw):
+                    text.set_text(f"{raw_val:.2f}")
+                region = np.asarray(renderer.buffer_rgba())[top:bottom, left:right]
+                region[...] = np.frombuffer(zlib.decompress(self.background), dtype=np.uint8).reshape(region.shape)
+                for artist in self.dynamic:
+                    artist.draw(renderer)
+                pixels = np.asarray(renderer.buffer_rgba())[y0:y1, x0:x1, :3].copy()
+        if not fits:
+            # A title wider than the chart widens the box past the kept pixels
+            return figure_to_bytes(plot_radial_bar_grouped(row, self.metric_groups, self.group_colors), fmt)
+
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format=fmt.upper())
+        return buf.getvalue()
+
+# A layer is its artists plus a few hundred KB of compressed pixels; the canvas
+# is shared. Per process: app server and each export worker.
+RADAR_LAYER_CACHE_SIZE = 8
+_radar_layers = OrderedDict()
+_radar_layers_lock = threading.Lock()
+
+def radar_layer(metric_groups, group_colors) -> RadarLayer:
+    key = (tuple(metric_groups.items()), tuple(group_colors.items()))
+    with _radar_layers_lock:
+        layer = _radar_layers.get(key)
+        if layer is None:
+            layer = _radar_layers[key] = RadarLayer(metric_groups, group_colors)
+            if len(_radar_layers) > RADAR_LAYER_CACHE_SIZE:
+                _radar_layers.popitem(last=False)
+        else:
+            _radar_layers.move_to_end(key)
+        return layer
+
+def render_radar(row, metric_groups, group_colors, fmt: str = RADAR_IMAGE_FORMAT) -> bytes:
+    # The image figure_to_bytes(plot_radial_bar_grouped(...)) gives, drawn on the template's reused layer
+    return radar_layer(metric_groups, group_colors).render(row, fmt)
+
+def z_score_badge(avg_z: float):
+    if avg_z >= 1.0:
+        return ("Excellent", "#228B22")
+    elif avg_z >= 0.3:
+        return ("Good", "#1E90FF")
+    elif avg_z >= -0.3:
+        return ("Average", "#DAA520")
+    return ("Below Average", "#DC143C")
+
+# ---------- Image bytes and cache ----------
+def figure_to_bytes(fig, fmt: str = RADAR_IMAGE_FORMAT) -> bytes:
+    # Always close, pyplot keeps every open figure alive otherwise
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format=fmt, dpi=200, bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    return buf.getvalue()
+
+class RadarImageCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data: bytes):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            if len(data) > self.max_bytes:
+                return
+            self._items[key] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+
+# ---------- Batch export ----------
+def _init_render_worker():
+    matplotlib.use("Agg")
+
+def render_player_radar(player_row: pd.DataFrame, metric_groups, group_colors, fmt: str = RADAR_IMAGE_FORMAT) -> bytes:
+    # Runs in a worker process; player_row is the single plot_data row to draw.
+    # Each worker builds a template's layer on its first player and reuses it.
+    return render_radar(player_row, metric_groups, group_colors, fmt)
+
+def render_radars_parallel(player_rows, metric_groups, group_colors, fmt: str = RADAR_IMAGE_FORMAT,
+                           max_workers: int = RADAR_EXPORT_WORKERS, on_progress=None) -> list:
+    # player_rows is a list of one-row plot_data frames; images come back in the same order
+    images = [None] * len(player_rows)
+    if not player_rows:
+        return images
+    ctx = multiprocessing.get_context("spawn")  # never fork a threaded server process
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, initializer=_init_render_worker) as pool:
+        futures = {
+            pool.submit(render_player_radar, row, metric_groups, group_colors, fmt): i
+            for i, row in enumerate(player_rows)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            images[futures[future]] = future.result()
+            if on_progress is not None:
+                on_progress(done, len(player_rows))
+    return images
+
+def export_filename(position: int, player_name: str, fmt: str) -> str:
+    safe = re.sub(r"[^\w\-]+", "_", str(player_name)).strip("_") or "player"
+    return f"{position:03d}_{safe}.{fmt}"
+
+def radars_to_zip(player_names, images, fmt: str = RADAR_IMAGE_FORMAT) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for position, (name, image) in enumerate(zip(player_names, images), start=1):
+            zf.writestr(export_filename(position, name, fmt), image)
+    return buf.getvalue()
+
+def radars_to_pdf(images) -> bytes:
+    # One page per PNG radar, in ranking order
+    pages = [Image.open(io.BytesIO(image)).convert("RGB") for image in images]
+    buf = io.BytesIO()
+    pages[0].save(buf, format="PDF", save_all=True, append_images=pages[1:])
+    return buf.getvalue()
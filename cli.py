@@ -0,0 +1,151 @@
+# Batch scoring without Streamlit, for cron jobs and notebooks. Example:
+#   python cli.py exports/*.xlsx --template "Striker, All Round CF" --groups "Central Forward" \
+#       --min-minutes 900 --criterion "xG per 90 >= 60%" --out-dir out/ --radars zip --top 50
+# Stored leagues score as one population, optionally saving this week's export first:
+#   python cli.py epl.xlsx --save "Premier League" 2024/25 --leagues "Premier League" "La Liga" --groups "Central Forward"
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+import engine
+import charts
+import league_store
+
+CRITERION_RE = re.compile(r"^\s*(.+?)\s*(>=|<=|>|<)\s*(-?\d+(?:\.\d+)?)\s*(%?)\s*$")
+
+def parse_criterion(text: str):
+    # "Metric >= 2.5" is a raw threshold, "Metric >= 60%" a percentile one
+    match = CRITERION_RE.match(text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"criterion must look like 'Metric >= 60%' or 'Metric < 2.5', got {text!r}")
+    metric_name, op, thr, pct = match.groups()
+    return (metric_name, "Percentile" if pct else "Raw", op, float(thr))
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w\-]+", "_", text).strip("_")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Score player exports against a position template and write rankings and radars.")
+    parser.add_argument("inputs", nargs="*", help="Export files (.xlsx, .csv, .parquet, .feather, .arrow)")
+    parser.add_argument("--save", nargs=2, metavar=("LEAGUE", "SEASON"), help="Also save each input to the league store under this league and season; stored players with the same name and height are replaced")
+    parser.add_argument("--leagues", nargs="+", default=[], help="Score these leagues from the league store, as one population")
+    parser.add_argument("--seasons", nargs="+", default=[], help="Only these stored seasons (default: all)")
+    parser.add_argument("--store-dir", default=league_store.STORE_DIR)
+    parser.add_argument("--template", choices=list(engine.position_metrics), help="Position template; defaults to the group's default when one --groups value is given")
+    parser.add_argument("--min-minutes", type=int, default=1000)
+    parser.add_argument("--age-min", type=int)
+    parser.add_argument("--age-max", type=int)
+    parser.add_argument("--groups", nargs="*", default=[], choices=engine.SIX_GROUPS, metavar="GROUP", help="Six-group positions to include")
+    parser.add_argument("--reference-minutes", type=int, help="Measure percentiles against the same six-group's players over this many minutes instead of the filtered pool")
+    parser.add_argument("--criterion", action="append", type=parse_criterion, default=[], help="Essential criterion, repeatable (all must hold)")
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Ranking file format")
+    parser.add_argument("--radars", choices=["none", "zip", "pdf", "png"], default="none", help="Also render radars for the ranking")
+    parser.add_argument("--top", type=int, default=0, help="Only render the top N radars (0 means all)")
+    parser.add_argument("--workers", type=int, default=charts.RADAR_EXPORT_WORKERS)
+    return parser
+
+def write_radars(plot_data, ranking, template: str, out_base: str, kind: str, top: int, workers: int) -> str:
+    positions = {k: i for i, k in enumerate(plot_data["Player key"])}
+    ranked_keys = ranking["Player key"].iloc[:top] if top else ranking["Player key"]
+    player_rows = [plot_data.iloc[[positions[k]]] for k in ranked_keys]
+    names = [row["Player"].iloc[0] for row in player_rows]
+    images = charts.render_radars_parallel(
+        player_rows, engine.position_metrics[template]["groups"], charts.group_colors, max_workers=workers
+    )
+    if kind == "zip":
+        path = f"{out_base}_radars.zip"
+        with open(path, "wb") as fh:
+            fh.write(charts.radars_to_zip(names, images))
+    elif kind == "pdf":
+        path = f"{out_base}_radars.pdf"
+        with open(path, "wb") as fh:
+            fh.write(charts.radars_to_pdf(images))
+    else:
+        path = f"{out_base}_radars"
+        os.makedirs(path, exist_ok=True)
+        for position, (name, image) in enumerate(zip(names, images), start=1):
+            with open(os.path.join(path, charts.export_filename(position, name, charts.RADAR_IMAGE_FORMAT)), "wb") as fh:
+                fh.write(image)
+    return path
+
+def load_file(path: str, save, store_dir: str):
+    base, unmapped_positions = engine.load_dataset_file(path)
+    if save:
+        league_store.append(base, *save, store_dir=store_dir)
+    return base, unmapped_positions
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if engine.CUSTOM_TEMPLATES_ERROR:
+        print(f"custom templates skipped, {engine.CUSTOM_TEMPLATES_ERROR}", file=sys.stderr)
+
+    template = args.template
+    if template is None:
+        if len(args.groups) != 1:
+            parser.error("--template is required unless exactly one --groups value is given")
+        template = engine.DEFAULT_TEMPLATE[args.groups[0]]
+
+    age_range = None
+    if args.age_min is not None or args.age_max is not None:
+        age_range = (
+            args.age_min if args.age_min is not None else -np.inf,
+            args.age_max if args.age_max is not None else np.inf,
+        )
+
+    if not args.inputs and not args.leagues:
+        parser.error("give export files, --leagues, or both")
+
+    # (label, output name, loader); the files load first, so a --save lands before the store is read
+    sources = [(path, os.path.splitext(os.path.basename(path))[0], lambda path=path: load_file(path, args.save, args.store_dir)) for path in args.inputs]
+    if args.leagues:
+        # Filters are pushed into the store scan; with a fixed reference only the
+        # minutes can be, since the reference spans every age and group
+        if args.reference_minutes is None:
+            pushdown = dict(min_minutes=args.min_minutes, age_range=age_range, groups=tuple(args.groups))
+        else:
+            pushdown = dict(min_minutes=min(args.min_minutes, args.reference_minutes))
+        sources.append((
+            f"store {', '.join(args.leagues)}", "_".join(["store"] + args.leagues + args.seasons),
+            lambda: (league_store.query(args.leagues, args.seasons, store_dir=args.store_dir, **pushdown), pd.Series(dtype="int64")),
+        ))
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for path, stem, load in sources:
+        try:
+            base, unmapped_positions = load()
+        except ValueError as exc:
+            print(f"{path}: {exc}", file=sys.stderr)
+            return 2
+        try:
+            plot_data, ranking = engine.run_pipeline(
+                base, template, args.min_minutes, age_range, tuple(args.groups), tuple(args.criterion), args.reference_minutes
+            )
+        except KeyError as exc:
+            print(f"{path}: column {exc} is not a numeric column of this export", file=sys.stderr)
+            return 2
+
+        out_base = os.path.join(args.out_dir, f"{_slug(stem)}_{_slug(template)}")
+        ranking_out = ranking.drop(columns=["Player key"])
+        if args.format == "parquet":
+            ranking_path = f"{out_base}.parquet"
+            ranking_out.to_parquet(ranking_path)
+        else:
+            ranking_path = f"{out_base}.csv"
+            ranking_out.to_csv(ranking_path)
+
+        line = f"{path}: {len(ranking)} players ranked -> {ranking_path}"
+        if args.radars != "none" and len(ranking):
+            line += f", radars -> {write_radars(plot_data, ranking, template, out_base, args.radars, args.top, args.workers)}"
+        if not unmapped_positions.empty:
+            line += f" ({len(unmapped_positions)} unmapped position codes)"
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# Opt-in per-rerun instrumentation: wall time and peak traced memory for each
+# pipeline stage, plus cache hit/miss counts, shown in the app and appended to
+# a JSONL trace that can be aggregated across sessions.
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+
+TRACE_PATH = os.environ.get("RADAR_TRACE_PATH", os.path.join(os.environ.get("RADAR_CACHE_DIR", ".radar_cache"), "diagnostics.jsonl"))
+
+# Process-wide, every session's cached calls count here
+_lock = threading.Lock()
+cache_calls = Counter()
+cache_misses = Counter()
+
+def count_calls(fn):
+    # Outermost decorator on a cached function: counts every call, hit or miss
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            cache_calls[name] += 1
+        return fn(*args, **kwargs)
+    return wrapper
+
+def count_miss(name: str):
+    # Called from inside a cached function body, which only runs on a miss
+    with _lock:
+        cache_misses[name] += 1
+
+def cache_snapshot():
+    with _lock:
+        return Counter(cache_calls), Counter(cache_misses)
+
+# tracemalloc slows every allocation in the process, so it only runs while at
+# least one session has diagnostics switched on. Sessions go through a
+# MemoryTracing handle, which pairs every start with exactly one stop.
+_tracing_sessions = 0
+
+def start_memory_tracing():
+    global _tracing_sessions
+    with _lock:
+        _tracing_sessions += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+def stop_memory_tracing():
+    global _tracing_sessions
+    with _lock:
+        _tracing_sessions = max(0, _tracing_sessions - 1)
+        if _tracing_sessions == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+class MemoryTracing:
+    # One per session, kept in its session state. Dropped with that state when
+    # the session ends, so a session closed with diagnostics on stops counting.
+    def __init__(self):
+        self._release = None
+
+    def set(self, on: bool):
+        if on and self._release is None:
+            start_memory_tracing()
+            self._release = weakref.finalize(self, stop_memory_tracing)
+        elif not on and self._release is not None:
+            self._release()  # runs stop_memory_tracing once and detaches
+            self._release = None
+
+class StageRecorder:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.stages = []
+        self._cache_start = cache_snapshot() if enabled else None
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            mem_start = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                "stage": name,
+                "seconds": time.perf_counter() - start,
+                "peak_bytes": tracemalloc.get_traced_memory()[1] - mem_start if tracing else None,
+            })
+
+    def cache_counts(self) -> dict:
+        # Calls and misses since this rerun started (other sessions' reruns may overlap)
+        calls_start, misses_start = self._cache_start
+        calls, misses = cache_snapshot()
+        counts = {}
+        for name in sorted(calls):
+            n_calls = calls[name] - calls_start[name]
+            n_misses = misses[name] - misses_start[name]
+            if n_calls:
+                counts[name] = {"hits": n_calls - n_misses, "misses": n_misses}
+        return counts
+
+    def append_trace(self, path: str = TRACE_PATH, **context):
+        record = {"ts": time.time(), **context, "stages": self.stages, "cache": self.cache_counts()}
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with _lock, open(path, "a") as fh:
+                fh.write(json.dumps(record, default=str) + "\n")
+        except OSError:
+            pass
@@ -0,0 +1,705 @@
+# Scoring engine behind the radar app, importable without Streamlit.
+# app.py wraps these stages in its caches, cli.py and notebooks call them directly.
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ========== 6-position mapping ==========
+SIX_GROUPS = [
+    "Goalkeeper",
+    "Wide Defender",
+    "Central Defender",
+    "Central Midfielder",
+    "Wide Midfielder",
+    "Central Forward"
+]
+
+RAW_TO_SIX = {
+    # Goalkeeper
+    "GK": "Goalkeeper", "GKP": "Goalkeeper", "GOALKEEPER": "Goalkeeper",
+
+    # Wide Defender
+    "RB": "Wide Defender", "LB": "Wide Defender",
+    "RWB": "Wide Defender", "LWB": "Wide Defender", "RFB": "Wide Defender", "LFB": "Wide Defender",
+
+    # Central Defender
+    "CB": "Central Defender", "RCB": "Central Defender", "LCB": "Central Defender",
+    "CBR": "Central Defender", "CBL": "Central Defender", "SW": "Central Defender",
+
+    # Central Midfielder
+    "CMF": "Central Midfielder", "CM": "Central Midfielder",
+    "RCMF": "Central Midfielder", "RCM": "Central Midfielder",
+    "LCMF": "Central Midfielder", "LCM": "Central Midfielder",
+    "DMF": "Central Midfielder", "DM": "Central Midfielder", "CDM": "Central Midfielder",
+    "RDMF": "Central Midfielder", "RDM": "Central Midfielder",
+    "LDMF": "Central Midfielder", "LDM": "Central Midfielder",
+    "AMF": "Central Midfielder", "AM": "Central Midfielder", "CAM": "Central Midfielder",
+    "SS": "Central Midfielder", "10": "Central Midfielder",
+
+    # Wide Midfielder
+    "LWF": "Wide Midfielder", "RWF": "Wide Midfielder",
+    "RW": "Wide Midfielder", "LW": "Wide Midfielder",
+    "LAMF": "Wide Midfielder", "RAMF": "Wide Midfielder",
+    "RM": "Wide Midfielder", "LM": "Wide Midfielder",
+    "WF": "Wide Midfielder", "RWG": "Wide Midfielder", "LWG": "Wide Midfielder", "W": "Wide Midfielder",
+
+    # Central Forward
+    "CF": "Central Forward", "ST": "Central Forward", "9": "Central Forward",
+    "FW": "Central Forward", "STK": "Central Forward", "CFW": "Central Forward"
+}
+
+def _clean_pos_token(tok: str) -> str:
+    if pd.isna(tok):
+        return ""
+    t = str(tok).upper()
+    t = t.replace(".", "").replace("-", "").replace(" ", "")
+    return t
+
+def parse_first_position(cell) -> str:
+    if pd.isna(cell):
+        return ""
+    first = re.split(r"[,/]", str(cell))[0].strip()
+    return _clean_pos_token(first)
+
+def map_first_position_to_group(cell) -> str:
+    tok = parse_first_position(cell)
+    return RAW_TO_SIX.get(tok, "Wide Midfielder")  # safe default
+
+def map_positions_to_groups(positions: pd.Series):
+    # Same rules as map_first_position_to_group, but only the distinct strings
+    # are parsed (a few hundred per export), then codes are broadcast to rows.
+    codes, uniques = pd.factorize(positions)
+    tokens = (
+        pd.Series(uniques, dtype="object").astype(str)
+        .str.split(r"[,/]", n=1, regex=True).str[0]
+        .str.strip().str.upper()
+        .str.replace(r"[.\- ]", "", regex=True)
+    )
+    mapped = tokens.map(RAW_TO_SIX)
+    group_codes = pd.Categorical(mapped.fillna("Wide Midfielder"), categories=SIX_GROUPS).codes
+    default_code = SIX_GROUPS.index("Wide Midfielder")
+    row_codes = np.where(codes >= 0, group_codes[codes], default_code) if len(group_codes) else np.full(len(codes), default_code)
+    groups = pd.Series(pd.Categorical.from_codes(row_codes, categories=SIX_GROUPS), index=positions.index)
+
+    # Tokens that fell back to the default, with the number of rows they cover
+    rows_per_unique = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    unmapped = mapped.isna() & (tokens != "")
+    unmapped_counts = (
+        pd.Series(rows_per_unique[unmapped.to_numpy()], index=tokens[unmapped].to_numpy())
+        .groupby(level=0).sum().sort_values(ascending=False)
+    )
+    return groups, unmapped_counts
+
+# ========== Position templates ==========
+# Templates are data: templates.json holds, for every template, its radar groups
+# in drawing order with each group's metrics, plus the group colours and each
+# six-group's default template. Analysts add their own templates in a file of
+# the same shape (custom_templates.json, or the path in RADAR_CUSTOM_TEMPLATES;
+# see custom_templates.example.json), no code edits needed. Both files are
+# validated once at import and compiled to index arrays over the metric columns.
+# A custom file that fails validation is skipped, with the reason kept in
+# CUSTOM_TEMPLATES_ERROR for the app and CLI to report.
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates.json")
+CUSTOM_TEMPLATES_PATH = os.environ.get(
+    "RADAR_CUSTOM_TEMPLATES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "custom_templates.json")
+)
+
+def _validate_templates(spec: dict, path: str, group_colors: dict, known=()) -> dict:
+    # {template: {group: [metrics]}}, or a ValueError naming the file and template
+    templates = spec.get("templates", {})
+    if not isinstance(templates, dict):
+        raise ValueError(f"{path}: 'templates' must map template names to their groups")
+    for name, groups in templates.items():
+        where = f"{path}: template {name!r}"
+        if name in known:
+            raise ValueError(f"{where} is already defined")
+        if not isinstance(groups, dict) or not groups:
+            raise ValueError(f"{where} needs at least one group of metrics")
+        seen = set()
+        for group, metrics in groups.items():
+            if group not in group_colors:
+                raise ValueError(f"{where}: group {group!r} has no colour in group_colors")
+            if not isinstance(metrics, list) or not metrics or not all(isinstance(m, str) and m for m in metrics):
+                raise ValueError(f"{where}: group {group!r} must be a non-empty list of column names")
+            repeated = sorted(seen.intersection(metrics) | {m for m in metrics if metrics.count(m) > 1})
+            if repeated:
+                raise ValueError(f"{where}: {repeated} listed more than once")
+            seen.update(metrics)
+    return templates
+
+def _load_custom_templates(custom_path: str, templates: dict, group_colors: dict):
+    # (templates, group colours) with the custom file's added, or a ValueError
+    try:
+        with open(custom_path, encoding="utf-8") as fh:
+            custom = json.load(fh)
+    except OSError as exc:
+        raise ValueError(f"{custom_path}: {exc.strerror or exc}") from exc
+    except ValueError as exc:
+        raise ValueError(f"{custom_path}: not valid JSON ({exc})") from exc
+    if not isinstance(custom, dict):
+        raise ValueError(f"{custom_path}: expected an object with 'templates' and 'group_colors'")
+    group_colors = dict(group_colors)
+    for group, color in custom.get("group_colors", {}).items():
+        group_colors.setdefault(group, color)
+    return {**templates, **_validate_templates(custom, custom_path, group_colors, templates)}, group_colors
+
+def load_templates(path: str = TEMPLATES_PATH, custom_path: str = CUSTOM_TEMPLATES_PATH):
+    # (templates, default template per six-group, group colours, custom file
+    # error or None); custom templates come after the built-in ones and may add
+    # groups, not replace any. A custom file that does not validate is skipped.
+    with open(path, encoding="utf-8") as fh:
+        spec = json.load(fh)
+    group_colors = dict(spec["group_colors"])
+    templates = _validate_templates(spec, path, group_colors)
+    defaults = dict(spec["defaults"])
+    missing = [g for g in SIX_GROUPS if defaults.get(g) not in templates]
+    if missing:
+        raise ValueError(f"{path}: no default template for {missing}")
+    custom_error = None
+    if custom_path and os.path.exists(custom_path):
+        try:
+            templates, group_colors = _load_custom_templates(custom_path, templates, group_colors)
+        except ValueError as exc:
+            custom_error = str(exc)
+    return templates, defaults, group_colors, custom_error
+
+_templates, DEFAULT_TEMPLATE, GROUP_COLORS, CUSTOM_TEMPLATES_ERROR = load_templates()
+GROUP_NAMES = list(GROUP_COLORS)
+
+# Every metric any template uses. Percentile frames have exactly these columns
+# in this order, and prepare_frame puts them last in the prepared frame.
+ALL_TEMPLATE_METRICS = sorted({m for groups in _templates.values() for metrics in groups.values() for m in metrics})
+
+def compile_template(groups: dict) -> dict:
+    # "metrics" and "groups" (metric -> group, in radar order) keep the shape
+    # callers have always used; the index arrays are what scoring slices with
+    metric_pos = {m: j for j, m in enumerate(ALL_TEMPLATE_METRICS)}
+    metrics = [m for group_metrics in groups.values() for m in group_metrics]
+    return {
+        "metrics": metrics,
+        "groups": {m: group for group, group_metrics in groups.items() for m in group_metrics},
+        "metric_idx": np.array([metric_pos[m] for m in metrics], dtype=np.intp),
+        "group_ids": np.array([GROUP_NAMES.index(group) for group, group_metrics in groups.items() for _ in group_metrics], dtype=np.intp),
+    }
+
+position_metrics = {name: compile_template(groups) for name, groups in _templates.items()}
+
+# ---------- Ingest ----------
+minutes_col = "Minutes played"
+UPLOAD_TYPES = ["xlsx", "csv", "parquet", "feather", "arrow"]
+
+# Columnar copies of uploaded workbooks, so a repeat upload skips openpyxl
+SIDECAR_DIR = os.environ.get("RADAR_CACHE_DIR", ".radar_cache")
+SIDECAR_MAX_FILES = 20
+SIDECAR_VERSION = 2  # 2: every sheet of the workbook, not only the first
+
+# Workbooks with one sheet per competition are parsed a sheet per process, and
+# every row is tagged with its sheet name in LEAGUE_COL
+LEAGUE_COL = "League"
+EXCEL_SHEET_WORKERS = max(1, min(8, os.cpu_count() or 1))
+EXCEL_PARALLEL_MIN_BYTES = 2 * 2**20  # openpyxl parses about 0.5 MB/s; a spawned worker takes ~1 s to start
+
+keep_cols = ["Player", "Team within selected timeframe", "Team", "Age", "Height", "Positions played", "Minutes played"]
+# Only these columns are read, everything else in the export is skipped
+INGEST_COLUMNS = set(ALL_TEMPLATE_METRICS) | set(keep_cols) | {"Position", minutes_col, LEAGUE_COL}
+
+# Typed schema of the prepared frame: metrics as float32, repeated strings as
+# categoricals, percentiles as integer tenths (33.3 is stored as 333)
+METRIC_DTYPE = np.float32
+TEXT_COLUMNS = ["Player", "Team", "Team within selected timeframe", "Positions played"]
+PERCENTILE_SCALE = 10
+PERCENTILE_MISSING = np.iinfo(np.uint16).max
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _projected(names) -> list:
+    return [c for c in names if c in INGEST_COLUMNS]
+
+def _write_sidecar(df: pd.DataFrame, path: str):
+    # Best effort: a read-only or full disk just means the next load parses the workbook again
+    try:
+        os.makedirs(SIDECAR_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        sidecars = sorted(
+            (os.path.join(SIDECAR_DIR, f) for f in os.listdir(SIDECAR_DIR) if f.endswith(".parquet")),
+            key=os.path.getmtime, reverse=True,
+        )
+        for old_path in sidecars[SIDECAR_MAX_FILES:]:
+            os.remove(old_path)
+    except (OSError, ValueError, pa.ArrowException):
+        pass
+
+_worker_book = None
+
+def _open_worker_book(data: bytes):
+    # Pool initializer: each worker gets the workbook bytes once and opens the zip once
+    global _worker_book
+    _worker_book = pd.ExcelFile(io.BytesIO(data))
+
+def _read_sheet(sheet_name: str) -> pd.DataFrame:
+    # Runs in a worker process; openpyxl only parses this sheet's XML
+    return _worker_book.parse(sheet_name)
+
+def read_workbook(data: bytes, max_workers: int = EXCEL_SHEET_WORKERS, parallel_min_bytes: int = EXCEL_PARALLEL_MIN_BYTES) -> pd.DataFrame:
+    # Every sheet, concatenated. A single-sheet export reads as it always has.
+    # Workbooks under parallel_min_bytes parse in this process: starting the
+    # workers costs more than the sheets take.
+    parallel = max_workers > 1 and len(data) >= parallel_min_bytes
+    with pd.ExcelFile(io.BytesIO(data)) as book:
+        sheet_names = book.sheet_names
+        if len(sheet_names) == 1 or not parallel:
+            sheets = [book.parse(name) for name in sheet_names]
+    if len(sheet_names) > 1 and parallel:
+        ctx = multiprocessing.get_context("spawn")  # never fork a threaded server process
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(sheet_names)), mp_context=ctx, initializer=_open_worker_book, initargs=(data,)
+        ) as pool:
+            sheets = list(pool.map(_read_sheet, sheet_names))
+    for sheet in sheets:
+        sheet.columns = [str(c) for c in sheet.columns]
+    if len(sheets) == 1:
+        return sheets[0]
+    return pd.concat(
+        [sheet.assign(**{LEAGUE_COL: name}) for name, sheet in zip(sheet_names, sheets)], ignore_index=True
+    )
+
+def read_upload(data: bytes, file_type: str, digest: str) -> pd.DataFrame:
+    if file_type == "csv":
+        return pd.read_csv(io.BytesIO(data), usecols=lambda c: c in INGEST_COLUMNS)
+    if file_type == "parquet":
+        pf = pq.ParquetFile(io.BytesIO(data))
+        return pf.read(columns=_projected(pf.schema_arrow.names)).to_pandas()
+    if file_type in ("feather", "arrow"):
+        reader = pa.ipc.open_file(io.BytesIO(data))
+        table = reader.read_all()
+        return table.select(_projected(table.column_names)).to_pandas()
+
+    # Excel: convert the whole workbook once, later loads read the projected sidecar
+    sidecar = os.path.join(SIDECAR_DIR, f"{digest}-v{SIDECAR_VERSION}.parquet")
+    if os.path.exists(sidecar):
+        try:
+            pf = pq.ParquetFile(sidecar)
+            return pf.read(columns=_projected(pf.schema_arrow.names)).to_pandas()
+        except (OSError, pa.ArrowException):
+            pass
+    full = read_workbook(data)
+    _write_sidecar(full, sidecar)
+    return full[_projected(full.columns)]
+
+def prepare_frame(df: pd.DataFrame):
+    # Positions, numeric minutes/age and template metrics, coerced once per file
+    if "Position" in df.columns:
+        df["Positions played"] = df["Position"].astype(str)
+        df["Six-Group Position"], unmapped_positions = map_positions_to_groups(df["Position"])
+    else:
+        df["Positions played"] = np.nan
+        df["Six-Group Position"] = pd.Categorical([np.nan] * len(df), categories=SIX_GROUPS)
+        unmapped_positions = pd.Series(dtype="int64")
+
+    df["_minutes_numeric"] = pd.to_numeric(df.get(minutes_col, np.nan), errors="coerce")
+    df["_age_numeric"] = pd.to_numeric(df.get("Age", np.nan), errors="coerce")
+
+    for c in keep_cols:
+        if c not in df.columns:
+            df[c] = np.nan
+    for c in TEXT_COLUMNS + [LEAGUE_COL]:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+
+    # Every template metric exists and is numeric. Missing values stay NaN here:
+    # scoring counts them as 0, Essential Criteria only for the selected template
+    for m in ALL_TEMPLATE_METRICS:
+        if m in df.columns:
+            df[m] = pd.to_numeric(df[m], errors="coerce").astype(METRIC_DTYPE)
+        else:
+            df[m] = np.full(len(df), np.nan, dtype=METRIC_DTYPE)
+
+    # Only referenced columns survive; the raw "Position" codes live on in "Positions played"
+    derived = [LEAGUE_COL, "Six-Group Position", "_minutes_numeric", "_age_numeric"]
+    df = df[list(dict.fromkeys(keep_cols + [c for c in derived if c in df.columns] + ALL_TEMPLATE_METRICS))]
+    return df, unmapped_positions
+
+def to_tenths(percentiles: np.ndarray) -> np.ndarray:
+    tenths = np.rint(np.asarray(percentiles, dtype=float) * PERCENTILE_SCALE)
+    return np.where(np.isnan(tenths), PERCENTILE_MISSING, tenths).astype(np.uint16)
+
+def from_tenths(tenths) -> np.ndarray:
+    # Back to the rounded percentile the app shows: 333 -> 33.3, exactly as round(1) gives it
+    tenths = np.asarray(tenths)
+    return np.where(tenths == PERCENTILE_MISSING, np.nan, tenths / PERCENTILE_SCALE)
+
+def missing_as_zero(values: np.ndarray) -> np.ndarray:
+    # Metric values as scored: a value the export lacks counts as 0
+    return np.where(np.isnan(values), values.dtype.type(0), values)
+
+def widen_metrics(values: np.ndarray) -> np.ndarray:
+    # float32 -> the float64 the export held, through the shortest decimal that
+    # round-trips, so the radar's raw values format exactly as before
+    return np.asarray(values, dtype=METRIC_DTYPE).astype(str).astype(float)
+
+def load_dataset(data: bytes, file_type: str, digest: str = None):
+    # The prepared base frame plus the position codes that fell back to the default
+    return prepare_frame(read_upload(data, file_type, digest or file_digest(data)))
+
+def load_dataset_file(path: str):
+    with open(path, "rb") as fh:
+        data = fh.read()
+    return load_dataset(data, os.path.splitext(path)[1].lstrip(".").lower())
+
+# ---------- Shared dataset store ----------
+# One prepared copy per file on local disk, shared by every session and server
+# process: the numeric matrix as a .npy that is memory-mapped read-only (the OS
+# keeps a single copy of its pages), the text columns as a small Parquet file.
+DATASET_STORE_VERSION = 4
+DATASET_STORE_MAX = 20
+
+def _dataset_dir(digest: str) -> str:
+    # The schema is part of the key, so a template or column change never attaches a stale layout
+    schema = hashlib.sha1(repr((DATASET_STORE_VERSION, keep_cols, ALL_TEMPLATE_METRICS)).encode()).hexdigest()[:12]
+    return os.path.join(SIDECAR_DIR, "datasets", f"{digest}-{schema}")
+
+def publish_dataset(digest: str, base: pd.DataFrame, unmapped_positions: pd.Series) -> bool:
+    # Best effort, like the sidecars: False means this process keeps its private copy
+    path = _dataset_dir(digest)
+    if os.path.isdir(path):
+        return True
+    matrix, col_index = numeric_matrix(base)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "numeric.npy"), matrix)
+        base.drop(columns=ALL_TEMPLATE_METRICS).to_parquet(os.path.join(tmp_path, "columns.parquet"))
+        with open(os.path.join(tmp_path, "layout.json"), "w") as fh:
+            json.dump({
+                "numeric_columns": list(col_index),
+                "unmapped_positions": {str(k): int(v) for k, v in unmapped_positions.items()},
+            }, fh)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another session or worker published the same file first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        stored = sorted(
+            (os.path.join(os.path.dirname(path), d) for d in os.listdir(os.path.dirname(path)) if ".tmp-" not in d),
+            key=os.path.getmtime, reverse=True,
+        )
+        # Processes still attached keep their mapping of a removed file until they drop it
+        for old_path in stored[DATASET_STORE_MAX:]:
+            shutil.rmtree(old_path, ignore_errors=True)
+    except (OSError, ValueError, pa.ArrowException):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return os.path.isdir(path)
+
+def attach_numeric(digest: str):
+    # The numeric_matrix() of a published file as a read-only memory map, or None
+    path = _dataset_dir(digest)
+    try:
+        with open(os.path.join(path, "layout.json")) as fh:
+            layout = json.load(fh)
+        matrix = np.load(os.path.join(path, "numeric.npy"), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return (matrix, {c: j for j, c in enumerate(layout["numeric_columns"])}), layout
+
+def attach_dataset(digest: str):
+    # (base, unmapped_positions, numeric) with the metric columns and the numeric
+    # matrix backed by the shared read-only mapping, or None if not published
+    attached = attach_numeric(digest)
+    if attached is None:
+        return None
+    (matrix, col_index), layout = attached
+    try:
+        columns = pd.read_parquet(os.path.join(_dataset_dir(digest), "columns.parquet"))
+    except (OSError, ValueError, pa.ArrowException):
+        return None
+
+    # prepare_frame puts the metrics last, so they are one contiguous slice of the
+    # column-major matrix and the frame's metric block is a view, not a copy
+    first = len(col_index) - len(ALL_TEMPLATE_METRICS)
+    if layout["numeric_columns"][first:] == ALL_TEMPLATE_METRICS:
+        metrics = matrix[:, first:]
+    else:
+        metrics = matrix[:, [col_index[m] for m in ALL_TEMPLATE_METRICS]]
+    base = pd.concat(
+        [columns, pd.DataFrame(metrics, columns=ALL_TEMPLATE_METRICS, index=columns.index, copy=False)], axis=1
+    )
+    unmapped_positions = pd.Series(layout["unmapped_positions"], dtype="int64")
+    return base, unmapped_positions, (matrix, col_index)
+
+def load_shared_dataset(data: bytes, file_type: str, digest: str = None):
+    # The first session to upload a file parses and publishes it, everyone after attaches
+    digest = digest or file_digest(data)
+    attached = attach_dataset(digest)
+    if attached is None:
+        base, unmapped_positions = load_dataset(data, file_type, digest)
+        if not publish_dataset(digest, base, unmapped_positions):
+            return base, unmapped_positions, numeric_matrix(base)
+        attached = attach_dataset(digest) or (base, unmapped_positions, numeric_matrix(base))
+    return attached
+
+# ---------- Pipeline stages ----------
+# ingest -> filter -> percentile -> score -> rank. The base frame is never
+# modified: filters return row positions and every stage reads through them.
+def filter_fingerprint(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def filter_rows(base: pd.DataFrame, min_minutes: int, age_range=None, groups: tuple = (), leagues: tuple = ()) -> np.ndarray:
+    mask = (base["_minutes_numeric"] >= min_minutes).to_numpy()
+    if age_range is not None:
+        mask = mask & base["_age_numeric"].between(*age_range).to_numpy()
+    if groups:
+        mask = mask & base["Six-Group Position"].isin(groups).to_numpy()
+    if leagues:
+        mask = mask & base[LEAGUE_COL].isin(leagues).to_numpy()
+    return np.flatnonzero(mask)
+
+def numeric_matrix(base: pd.DataFrame):
+    # Read-only column-major float32 copy of every numeric column, built once per file
+    cols = [c for c in base.columns if pd.api.types.is_numeric_dtype(base[c])]
+    matrix = np.asfortranarray(base[cols].to_numpy(dtype=METRIC_DTYPE))
+    matrix.setflags(write=False)
+    return matrix, {c: j for j, c in enumerate(cols)}
+
+def percentile_matrix(base: pd.DataFrame, rows: np.ndarray, numeric=None) -> pd.DataFrame:
+    # One rank over every metric any template uses; a template switch on the
+    # same population only slices columns. Values are uint16 tenths.
+    matrix, col_index = numeric if numeric is not None else numeric_matrix(base)
+    values = missing_as_zero(matrix[np.ix_(rows, [col_index[m] for m in ALL_TEMPLATE_METRICS])])
+    metric_values = pd.DataFrame(values, index=base.index[rows], columns=ALL_TEMPLATE_METRICS)
+    # Encoded as one array, so an empty population gives an empty frame
+    percentiles = metric_values.rank(pct=True).mul(100).round(1).to_numpy()
+    return pd.DataFrame(to_tenths(percentiles), index=metric_values.index, columns=ALL_TEMPLATE_METRICS)
+
+# ---------- Reference-population percentiles ----------
+# Percentiles measured against a fixed population (every player over
+# REFERENCE_MIN_MINUTES in the same six-group) instead of the filtered pool,
+# so a player's radar does not move when the filters change.
+REFERENCE_MIN_MINUTES = 900
+
+def reference_index(base: pd.DataFrame, min_minutes: int = REFERENCE_MIN_MINUTES, numeric=None) -> dict:
+    # Six-group -> reference players x ALL_TEMPLATE_METRICS, each column sorted.
+    # None holds every group, used for players whose group has no reference.
+    matrix, col_index = numeric if numeric is not None else numeric_matrix(base)
+    cols = [col_index[m] for m in ALL_TEMPLATE_METRICS]
+    reference = {None: np.sort(missing_as_zero(matrix[np.ix_(filter_rows(base, min_minutes), cols)]), axis=0)}
+    for group in SIX_GROUPS:
+        reference[group] = np.sort(missing_as_zero(matrix[np.ix_(filter_rows(base, min_minutes, None, (group,)), cols)]), axis=0)
+    return reference
+
+def reference_percentiles(base: pd.DataFrame, rows: np.ndarray, reference: dict, numeric=None) -> pd.DataFrame:
+    # Same scale as percentile_matrix: a value found in the reference gets its
+    # average rank, one between reference values the share strictly below it
+    matrix, col_index = numeric if numeric is not None else numeric_matrix(base)
+    cols = [col_index[m] for m in ALL_TEMPLATE_METRICS]
+    group_codes = base["Six-Group Position"].cat.codes.to_numpy()[rows]  # -1 where unknown
+    out = np.full((len(rows), len(cols)), np.nan)
+    for code, group in enumerate(SIX_GROUPS + [None]):
+        sel = np.flatnonzero(group_codes == (-1 if group is None else code))
+        sorted_ref = reference[group] if len(reference[group]) else reference[None]
+        if not len(sel) or not len(sorted_ref):
+            continue
+        values = missing_as_zero(matrix[np.ix_(rows[sel], cols)])
+        for j in range(len(cols)):
+            left = np.searchsorted(sorted_ref[:, j], values[:, j], side="left")
+            right = np.searchsorted(sorted_ref[:, j], values[:, j], side="right")
+            out[sel, j] = (left + right + (right > left)) / 2 / len(sorted_ref) * 100
+    return pd.DataFrame(to_tenths(np.round(out, 1)), index=base.index[rows], columns=ALL_TEMPLATE_METRICS)
+
+# ---------- Essential Criteria ----------
+CRITERIA_OPS = {">=": np.greater_equal, ">": np.greater, "<=": np.less_equal, "<": np.less}
+
+def percentile_to_raw_threshold(values: np.ndarray, op: str, thr: float):
+    # Turns "percentile op thr" into "value >= t" or "value <= t" with the same
+    # result as (rank(pct=True) * 100).round(1), using the sorted pool values.
+    sorted_vals = np.sort(values[~np.isnan(values)])
+    n = len(sorted_vals)
+    if n == 0:
+        return ">=", np.nan
+    uniq = np.unique(sorted_vals)
+    left = np.searchsorted(sorted_vals, uniq, side="left")
+    right = np.searchsorted(sorted_vals, uniq, side="right")
+    pct = np.round((left + 1 + right) / 2 / n * 100, 1)
+    hits = CRITERIA_OPS[op](pct, thr)
+    if not hits.any():
+        return ">=", np.nan  # NaN compares False, nobody passes
+    # Percentile never decreases with value, so the hits are a prefix or a suffix
+    if op in (">=", ">"):
+        return ">=", uniq[np.argmax(hits)]
+    return "<=", uniq[len(hits) - 1 - np.argmax(hits[::-1])]
+
+def criteria_mask(base: pd.DataFrame, pool_rows: np.ndarray, criteria, numeric=None, template: str = None):
+    # criteria are (metric, "Raw" | "Percentile", op, threshold) tuples, all
+    # evaluated in one pass over a (players x criteria) block of the numeric
+    # matrix; nothing is written into the frame. Missing values count as 0 for
+    # the template's metrics and fail every other criterion.
+    matrix, col_index = numeric if numeric is not None else numeric_matrix(base)
+    values = matrix[np.ix_(pool_rows, [col_index[metric_name] for metric_name, _, _, _ in criteria])]
+    if template is not None:
+        scored = np.isin([metric_name for metric_name, _, _, _ in criteria], position_metrics[template]["metrics"])
+        values[:, scored] = missing_as_zero(values[:, scored])
+
+    ops, thresholds = [], []
+    for j, (metric_name, mode, op, thr_val) in enumerate(criteria):
+        if mode == "Percentile":
+            op, thr_val = percentile_to_raw_threshold(values[:, j], op, thr_val)
+        ops.append(op)
+        thresholds.append(thr_val)
+    ops = np.array(ops)
+    thresholds = np.array(thresholds, dtype=float).astype(matrix.dtype)  # compare in the matrix's precision
+
+    passes = np.empty(values.shape, dtype=bool)
+    for op, compare in CRITERIA_OPS.items():
+        cols = np.flatnonzero(ops == op)
+        if len(cols):
+            passes[:, cols] = compare(values[:, cols], thresholds[cols])
+
+    return passes.all(axis=1), passes.sum(axis=0)
+
+# ---------- Players, scores and ranking ----------
+def player_index(base: pd.DataFrame, rows: np.ndarray):
+    # Stable key per row (name | team | row position in base) and a hash map from
+    # key to the row's position in this population's plot_data. Built once per
+    # pool, so duplicate or missing names stay distinct and lookups are O(1).
+    names = base["Player"].iloc[rows].astype(object)
+    teams = base["Team"].iloc[rows].astype(object).fillna(base["Team within selected timeframe"].iloc[rows].astype(object))
+    # Plain object arrays of str, so an empty population concatenates too
+    row_ids = np.asarray(rows).astype(str).astype(object)
+    name_strs = names.fillna("").astype(str).to_numpy(dtype=object)
+    team_strs = teams.astype(str).to_numpy(dtype=object)
+    keys = (name_strs + "|" + team_strs + "|" + row_ids).tolist()
+
+    # Labels only carry the team (and row id) where the name alone is ambiguous
+    named = pd.DataFrame({"name": names.to_numpy(), "team": team_strs})
+    labels = np.where(
+        named.duplicated(["name", "team"], keep=False), name_strs + " (" + team_strs + ", #" + row_ids + ")",
+        np.where(named.duplicated(["name"], keep=False), name_strs + " (" + team_strs + ")", name_strs)
+    )
+    has_name = names.notna().to_numpy()
+    options = [k for k, ok in zip(keys, has_name) if ok]
+    return keys, options, dict(zip(keys, labels)), {k: i for i, k in enumerate(keys)}, {k: i for i, k in enumerate(options)}
+
+def template_percentiles(percentiles: pd.DataFrame, template: str) -> np.ndarray:
+    # players x template metrics, decoded; a positional slice, no name lookups
+    return from_tenths(percentiles.to_numpy()[:, position_metrics[template]["metric_idx"]])
+
+def score_players(base: pd.DataFrame, rows: np.ndarray, template: str, percentiles: pd.DataFrame = None, player_keys=None) -> pd.DataFrame:
+    metrics = position_metrics[template]["metrics"]
+    if percentiles is None:
+        percentiles = percentile_matrix(base, rows)
+    if player_keys is None:
+        player_keys = player_index(base, rows)[0]
+    template_values = template_percentiles(percentiles, template)
+    percentile_df = pd.DataFrame(template_values, index=percentiles.index, columns=metrics)
+
+    # The only copy of player data a caller holds: selected rows x template
+    # columns, decoded back to plain strings and float64 for display
+    shown = base[keep_cols + metrics].iloc[rows]
+    shown = shown.astype({c: object for c in TEXT_COLUMNS}).assign(**{m: widen_metrics(missing_as_zero(shown[m].to_numpy())) for m in metrics})
+    plot_data = pd.concat([shown, percentile_df.add_suffix(" (percentile)")], axis=1)
+    plot_data["Player key"] = player_keys
+
+    z_scores_all = pd.DataFrame((template_values - 50) / 15, index=plot_data.index)
+    plot_data["Avg Z Score"] = z_scores_all.mean(axis=1)
+    plot_data["Rank"] = plot_data["Avg Z Score"].rank(ascending=False, method="min").astype(int)
+    return plot_data
+
+def top_order(values: np.ndarray, top_k: int = None) -> np.ndarray:
+    # Positions of the top_k largest values, largest first and ties in row
+    # order. argpartition finds the cut in O(n); only the kept rows get sorted.
+    n = len(values)
+    if top_k is None or top_k >= n:
+        return np.argsort(-values, kind="stable")
+    if top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+    cut = np.partition(values, n - top_k)[n - top_k]
+    candidates = np.flatnonzero(values >= cut)
+    return candidates[np.argsort(-values[candidates], kind="stable")][:top_k]
+
+def rank_players(plot_data: pd.DataFrame, top_k: int = None) -> pd.DataFrame:
+    cols_for_table = ["Player", "Positions played", "Age", "Team", "Team within selected timeframe", "Minutes played", "Avg Z Score", "Rank", "Player key"]
+    order = top_order(plot_data["Avg Z Score"].to_numpy(dtype=float), top_k)
+    z_ranking = plot_data[cols_for_table].iloc[order].reset_index(drop=True)
+    z_ranking[["Team", "Team within selected timeframe"]] = z_ranking[["Team", "Team within selected timeframe"]].fillna("N/A")
+    if "Age" in z_ranking:
+        z_ranking["Age"] = np.trunc(pd.to_numeric(z_ranking["Age"], errors="coerce")).astype("Int64")
+    z_ranking.index = np.arange(1, len(z_ranking) + 1)
+    z_ranking.index.name = "Row"
+    return z_ranking
+
+# ---------- Role fit across templates ----------
+def template_weights(template_names=None) -> np.ndarray:
+    # templates x ALL_TEMPLATE_METRICS; each row averages one template's radar
+    # metrics, so percentiles @ weights.T is every template's mean percentile
+    template_names = list(position_metrics) if template_names is None else list(template_names)
+    weights = np.zeros((len(template_names), len(ALL_TEMPLATE_METRICS)))
+    for i, name in enumerate(template_names):
+        cols = position_metrics[name]["metric_idx"]
+        weights[i, cols] = 1.0 / len(cols)
+    return weights
+
+def role_fit(percentiles: pd.DataFrame, template_names=None):
+    # Avg Z Score of every player under every template in one matrix product:
+    # mean((p - 50) / 15) == (p @ w - 50) / 15 when each w row sums to 1
+    template_names = list(position_metrics) if template_names is None else list(template_names)
+    scores = (from_tenths(percentiles.to_numpy()) @ template_weights(template_names).T - 50) / 15
+    fit = pd.DataFrame(scores, index=percentiles.index, columns=template_names)
+    best_col = scores.argmax(axis=1)
+    best = pd.DataFrame({
+        "Best role": np.asarray(template_names, dtype=object)[best_col],
+        "Best Avg Z Score": scores[np.arange(len(scores)), best_col],
+    }, index=percentiles.index)
+    return fit, best
+
+# ---------- Similar players ----------
+def similarity_index(percentiles: pd.DataFrame, template: str):
+    # Built once per population and template: players' centred percentile
+    # vectors, the same rows scaled to unit length, and their squared norms
+    vectors = ((template_percentiles(percentiles, template) - 50) / 15).astype(np.float32)
+    sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+    norms = np.sqrt(sq_norms)
+    unit = vectors / np.where(norms == 0, 1, norms)[:, None]
+    return vectors, unit, sq_norms
+
+def similar_players(index, query: int, top_n: int = 10, measure: str = "cosine"):
+    # Positions of the top_n players nearest to row `query` (itself excluded),
+    # best first, with their cosine similarity or Euclidean distance
+    vectors, unit, sq_norms = index
+    if measure == "cosine":
+        closeness = unit @ unit[query]
+    else:
+        closeness = -np.sqrt(np.maximum(sq_norms + sq_norms[query] - 2 * (vectors @ vectors[query]), 0))
+    closeness[query] = -np.inf
+    k = min(top_n, len(closeness) - 1)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    top = np.argpartition(-closeness, k - 1)[:k]
+    top = top[np.argsort(-closeness[top], kind="stable")]
+    return top, closeness[top] if measure == "cosine" else -closeness[top]
+
+def run_pipeline(base: pd.DataFrame, template: str, min_minutes: int = 1000, age_range=None, groups: tuple = (), criteria=(), reference_minutes: int = None, leagues: tuple = ()):
+    # Whole headless run over one prepared frame: (plot_data, ranking table).
+    # reference_minutes measures percentiles against that fixed population.
+    rows = filter_rows(base, min_minutes, age_range, tuple(groups), tuple(leagues))
+    if len(criteria) and len(rows):
+        mask, _ = criteria_mask(base, rows, criteria, template=template)
+        rows = rows[mask]
+    percentiles = None
+    if reference_minutes is not None:
+        numeric = numeric_matrix(base)
+        percentiles = reference_percentiles(base, rows, reference_index(base, reference_minutes, numeric), numeric)
+    plot_data = score_players(base, rows, template, percentiles)
+    return plot_data, rank_players(plot_data)
@@ -0,0 +1,149 @@
+# Persistent local store of prepared exports, one Parquet partition per
+# league and season, so leagues can be compared without merging workbooks.
+# Queries prune partitions and push the base filters down to the Parquet scan,
+# so only the matching rows and columns are ever read into pandas.
+import os
+import threading
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import engine
+
+STORE_DIR = os.environ.get("RADAR_STORE_DIR", "radar_store")
+PARTITIONING = ds.partitioning(pa.schema([("league", pa.string()), ("season", pa.string())]), flavor="hive")
+PARTITION_FILE = "data.parquet"
+
+_lock = threading.Lock()
+
+def _partition_path(store_dir: str, league: str, season: str) -> str:
+    return os.path.join(store_dir, f"league={quote(league, safe='')}", f"season={quote(season, safe='')}", PARTITION_FILE)
+
+def _dedup_keys(frame: pd.DataFrame) -> pd.Series:
+    # Re-uploading a league/season replaces the players it already holds. A player
+    # is name plus height: neither changes within a season, while the team does
+    # for anyone transferred mid-season and the age on a birthday. Namesakes of
+    # the same height count as one player.
+    heights = pd.to_numeric(frame["Height"], errors="coerce").astype(float)
+    return frame["Player"].astype(object).astype(str) + "|" + heights.astype(str)
+
+def _store_schema(base: pd.DataFrame) -> pd.DataFrame:
+    # One schema for every partition whatever the export held: text as plain
+    # strings, the other non-metric columns as float64, metrics as METRIC_DTYPE
+    frame = base.drop(columns=[c for c in (engine.LEAGUE_COL, "Season") if c in base.columns]).reset_index(drop=True)
+    if "_age_numeric" not in frame.columns:
+        frame["_age_numeric"] = np.nan
+    text = engine.TEXT_COLUMNS + ["Six-Group Position"]
+    numeric = [c for c in frame.columns if c not in text and c not in engine.ALL_TEMPLATE_METRICS]
+    return frame.astype({**{c: object for c in text}, **{c: float for c in numeric}})
+
+def partitions(store_dir: str = STORE_DIR) -> pd.DataFrame:
+    # League, season and player count of every stored partition, from the Parquet footers only
+    rows = []
+    if os.path.isdir(store_dir):
+        dataset = ds.dataset(store_dir, format="parquet", partitioning=PARTITIONING)
+        for fragment in dataset.get_fragments():
+            keys = ds.get_partition_keys(fragment.partition_expression)
+            rows.append({"league": keys["league"], "season": keys["season"], "players": fragment.metadata.num_rows})
+    return pd.DataFrame(rows, columns=["league", "season", "players"]).sort_values(["league", "season"], ignore_index=True)
+
+def _append_partition(base: pd.DataFrame, league: str, season: str, store_dir: str):
+    path = _partition_path(store_dir, league, season)
+    new = _store_schema(base)
+    with _lock:
+        replaced = 0
+        if os.path.exists(path):
+            old = pq.read_table(path).to_pandas()
+            stale = _dedup_keys(old).isin(set(_dedup_keys(new))).to_numpy()
+            replaced = int(stale.sum())
+            new = pd.concat([old[~stale], new], ignore_index=True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        pq.write_table(pa.Table.from_pandas(new, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+    return len(base), replaced
+
+def append(base: pd.DataFrame, league: str, season: str, store_dir: str = STORE_DIR):
+    # Writes a prepared frame into its league/season partition. Players already
+    # stored there (same name and height, see _dedup_keys) are replaced by the
+    # new rows; stored players missing from the new export are kept. With no league given, a
+    # multi-sheet upload goes to one partition per sheet, from its League column.
+    # Returns (rows written, stored rows replaced).
+    league, season = league.strip(), season.strip()
+    if not season:
+        raise ValueError("season must not be empty")
+    if league:
+        parts = [(league, base)]
+    elif engine.LEAGUE_COL in base.columns:
+        parts = [(str(name), frame) for name, frame in base.groupby(engine.LEAGUE_COL, observed=True)]
+    else:
+        raise ValueError("league must not be empty")
+    written = replaced = 0
+    for name, frame in parts:
+        part_written, part_replaced = _append_partition(frame, name, season, store_dir)
+        written += part_written
+        replaced += part_replaced
+    return written, replaced
+
+def store_fingerprint(store_dir: str = STORE_DIR) -> str:
+    # Changes whenever any partition is rewritten, so cached queries never serve stale rows
+    stats = []
+    for root, _, files in os.walk(store_dir):
+        for name in files:
+            if name == PARTITION_FILE:
+                st = os.stat(os.path.join(root, name))
+                stats.append((os.path.relpath(root, store_dir), st.st_mtime_ns, st.st_size))
+    return engine.filter_fingerprint(sorted(stats))
+
+def query(leagues=(), seasons=(), min_minutes: int = 0, age_range=None, groups: tuple = (), columns=None, store_dir: str = STORE_DIR):
+    # A prepared base frame (plus League and Season) for the chosen partitions,
+    # with engine.filter_rows's filters applied during the scan
+    if not os.path.isdir(store_dir):
+        raise ValueError(f"no league store at {store_dir!r}")
+    dataset = ds.dataset(store_dir, format="parquet", partitioning=PARTITIONING)
+    fragments = list(dataset.get_fragments())
+    if not fragments:
+        raise ValueError(f"the league store at {store_dir!r} holds no leagues yet")
+    # Partitions saved before a template added metrics lack those columns; scan
+    # with the union of every partition's schema (footers only) so none is dropped
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in fragments] + [PARTITIONING.schema])
+    dataset = ds.dataset(store_dir, format="parquet", partitioning=PARTITIONING, schema=schema)
+    expr = ds.field("_minutes_numeric") >= min_minutes
+    if leagues:
+        expr = expr & ds.field("league").isin(list(leagues))
+    if seasons:
+        expr = expr & ds.field("season").isin(list(seasons))
+    if age_range is not None:
+        lo, hi = age_range
+        if np.isfinite(lo):
+            expr = expr & (ds.field("_age_numeric") >= lo)
+        if np.isfinite(hi):
+            expr = expr & (ds.field("_age_numeric") <= hi)
+    if groups:
+        expr = expr & ds.field("Six-Group Position").isin(list(groups))
+
+    stored = set(dataset.schema.names)
+    wanted = columns if columns is not None else [c for c in dataset.schema.names if c not in ("league", "season")]
+    table = dataset.to_table(columns=[c for c in wanted if c in stored] + ["league", "season"], filter=expr)
+    base = table.to_pandas().rename(columns={"league": engine.LEAGUE_COL, "season": "Season"})
+
+    # Back to the typed schema engine.prepare_frame produces
+    for c in engine.TEXT_COLUMNS + [engine.LEAGUE_COL, "Season"]:
+        if c in base.columns:
+            base[c] = base[c].astype("category")
+    if "Six-Group Position" in base.columns:
+        base["Six-Group Position"] = pd.Categorical(base["Six-Group Position"], categories=engine.SIX_GROUPS)
+    # Metrics a partition predates (a template added since) read as missing, as in prepare_frame
+    for m in engine.ALL_TEMPLATE_METRICS:
+        base[m] = base[m].astype(engine.METRIC_DTYPE) if m in base.columns else np.full(len(base), np.nan, dtype=engine.METRIC_DTYPE)
+    for c in engine.keep_cols:
+        # Whole-number columns (minutes, height) display as integers, as they do from a file
+        if c in base.columns and pd.api.types.is_float_dtype(base[c]):
+            values = base[c].to_numpy()
+            if np.isfinite(values).all() and (values == np.trunc(values)).all():
+                base[c] = values.astype(np.int64)
+    return base